@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import fontTools.designspaceLib
+import fontTools.ttLib
+
+import build
+
+BENCHMARK_DIR = build.OUTPUT_DIR / "benchmark"
+RESULTS_FILE = BENCHMARK_DIR / "results.json"
+BASELINE_FILE = BENCHMARK_DIR / "baseline.json"
+
+# Benchmark slices
+# ****************************************************************
+# Each slice runs in a fresh interpreter with a fixed hash seed, so that no
+# caches carry over between runs and set ordering is repeatable. Only the
+# work inside build.measure() counts, setup is excluded.
+
+
+def redirect_output(output_dir: Path) -> None:
+    build.OUTPUT_DIR = output_dir
+    build.OUTPUT_OTF_DIR = output_dir / "otf"
+    build.OUTPUT_TTF_DIR = output_dir / "ttf"
+    build.OUTPUT_WOFF2_DIR = output_dir / "woff2"
+    build.OUTPUT_STATIC_OTF_DIR = build.OUTPUT_OTF_DIR / "static"
+    build.OUTPUT_STATIC_TTF_DIR = build.OUTPUT_TTF_DIR / "static"
+    build.OUTPUT_STATIC_WOFF2_DIR = build.OUTPUT_WOFF2_DIR / "static"
+
+
+def load_designspace() -> fontTools.designspaceLib.DesignSpaceDocument:
+    designspace = fontTools.designspaceLib.DesignSpaceDocument.fromfile(
+        build.INPUT_DIR / "CascadiaCode_variable.designspace"
+    )
+    designspace.instances = [
+        s
+        for s in designspace.instances
+        if s.lib.get("com.schriftgestaltung.export", True)
+    ]
+    return designspace
+
+
+def variable_font_path() -> Path:
+    # The VTT source is a complete variable Cascadia Code, so it stands in
+    # for a compiled one without having to build it first.
+    path = build.OUTPUT_TTF_DIR / "CascadiaCode.ttf"
+    path.parent.mkdir(exist_ok=True, parents=True)
+    shutil.copyfile(build.VTT_DATA_FILE, path)
+    return path
+
+
+def slice_variable() -> None:
+    designspace = load_designspace()
+    with build.measure("slice"):
+        build.build_font_variable(designspace, "Cascadia Code")
+
+
+def slice_static() -> None:
+    designspace = load_designspace()
+    instance = next(i for i in designspace.instances if i.styleName == "Regular")
+    with build.measure("slice"):
+        build.build_font_static(designspace, instance, "Cascadia Code")
+
+
+def slice_nf_merge() -> None:
+    designspace = load_designspace()
+    build.prepare_fonts(designspace, "Cascadia Code NF", merge_glyphs=False)
+    build.update_glyph_pack()
+    with build.measure("slice"):
+        for source in designspace.sources:
+            build.step_merge_glyphs("Cascadia Code NF", source.font, source.styleName)
+
+
+def slice_stat() -> None:
+    font = fontTools.ttLib.TTFont(build.VTT_DATA_FILE)
+    with build.measure("slice"):
+        build.add_stat_table(font, "CascadiaCode.ttf")
+
+
+def slice_woff2() -> None:
+    path = variable_font_path()
+    with build.measure("slice"):
+        build.to_woff2(path, build.OUTPUT_WOFF2_DIR / "CascadiaCode.woff2")
+
+
+SLICES: Dict[str, Callable[[], None]] = {
+    "variable": slice_variable,
+    "static": slice_static,
+    "nf-merge": slice_nf_merge,
+    "stat": slice_stat,
+    "woff2": slice_woff2,
+}
+
+
+def run_slice(name: str, output_dir: Path) -> Dict[str, Any]:
+    """Run one slice in a child interpreter and return its measurement."""
+    env = dict(os.environ, PYTHONHASHSEED="0")
+    result = subprocess.run(
+        [
+            sys.executable,
+            __file__,
+            "--run-slice",
+            name,
+            "--output-dir",
+            os.fspath(output_dir),
+        ],
+        env=env,
+        cwd=Path(__file__).parent,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    # The measurement is the last line, everything before is build output.
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+# Comparison
+# ****************************************************************
+
+
+def compare(
+    results: Dict[str, Any],
+    baseline: Dict[str, Any],
+    threshold: float,
+    min_delta: float,
+) -> List[str]:
+    regressions = []
+    print(f"{'Slice':<10} {'Baseline':>10} {'Now':>10} {'Change':>8}   Peak RSS change")
+    for name, now in results["slices"].items():
+        before = baseline["slices"].get(name)
+        if before is None:
+            print(f"{name:<10} {'-':>10} {now['wall']:>9.2f}s")
+            continue
+        change = now["wall"] / before["wall"] - 1
+        rss_change = None
+        if now["peak_rss"] and before["peak_rss"]:
+            rss_change = now["peak_rss"] / before["peak_rss"] - 1
+        print(
+            f"{name:<10} {before['wall']:>9.2f}s {now['wall']:>9.2f}s {change:>+8.0%}   "
+            + ("-" if rss_change is None else f"{rss_change:+.0%}")
+        )
+        # Sub-second slices jitter by more than any sensible threshold.
+        if change > threshold and now["wall"] - before["wall"] > min_delta:
+            regressions.append(f"{name}: wall time {change:+.0%}")
+        if rss_change is not None and rss_change > threshold:
+            regressions.append(f"{name}: peak RSS {rss_change:+.0%}")
+    return regressions
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "cpus": os.cpu_count(),
+        "tools": {tool: metadata.version(tool) for tool in build.CACHE_TOOLS},
+    }
+
+
+# Main benchmark script
+# ****************************************************************
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time slices of the font build and compare them to a baseline."
+    )
+    parser.add_argument(
+        "slices",
+        nargs="*",
+        metavar="SLICE",
+        help=f"Slices to run, out of {', '.join(SLICES)} (default: all).",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=3,
+        help="Runs per slice, the fastest one counts (default: %(default)s).",
+    )
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="Fail when a slice is slower or bigger than the baseline by more than this fraction (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--min-delta",
+        type=float,
+        default=0.5,
+        help="Ignore wall time changes smaller than this many seconds (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=BASELINE_FILE,
+        help="Baseline to compare against (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store these results as the new baseline instead of comparing.",
+    )
+    parser.add_argument("--run-slice", help=argparse.SUPPRESS)
+    parser.add_argument("--output-dir", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    for name in args.slices:
+        if name not in SLICES:
+            parser.error(f"unknown slice {name!r}, choose from {', '.join(SLICES)}")
+
+    if args.run_slice:
+        redirect_output(args.output_dir)
+        SLICES[args.run_slice]()
+        record = next(r for r in build.STEP_RECORDS if r["step"] == "slice")
+        print(json.dumps(record))
+        sys.exit(0)
+
+    results: Dict[str, Any] = {"environment": environment(), "slices": {}}
+    for name in args.slices or list(SLICES):
+        runs = []
+        for run in range(args.repeat):
+            print(f"[Benchmark] {name}, run {run + 1} of {args.repeat}")
+            with tempfile.TemporaryDirectory() as output_dir:
+                runs.append(run_slice(name, Path(output_dir)))
+        fastest = min(runs, key=lambda r: r["wall"])
+        results["slices"][name] = {
+            "wall": fastest["wall"],
+            "cpu": fastest["cpu"],
+            "peak_rss": max((r["peak_rss"] or 0 for r in runs), default=0) or None,
+            "runs": [r["wall"] for r in runs],
+        }
+
+    RESULTS_FILE.parent.mkdir(exist_ok=True, parents=True)
+    RESULTS_FILE.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {RESULTS_FILE}")
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(exist_ok=True, parents=True)
+        args.baseline.write_text(json.dumps(results, indent=2))
+        print(f"Baseline saved to {args.baseline}")
+        sys.exit(0)
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}, run with --save-baseline first.")
+        sys.exit(0)
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("environment") != results["environment"]:
+        print("Warning: the baseline was recorded with a different Python, machine or tool versions.")
+    regressions = compare(results, baseline, args.threshold, args.min_delta)
+    if regressions:
+        print(f"Regressions beyond {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("No regressions.")
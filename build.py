@@ -1,27 +1,82 @@
 import argparse
+import contextlib
+import cProfile
+import functools
+import hashlib
+import io
+import json
+import logging
+import mmap
 import multiprocessing
 import multiprocessing.pool
 import os
+import pickle
+import plistlib
+import queue
+import re
+import shutil
+import struct
 import subprocess
+import sys
+import time
+from array import array
+from importlib import metadata
 from pathlib import Path
-from typing import cast
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    cast,
+)
 import xml.etree.cElementTree as ET
 import tempfile
 import glob
+import copy
 
 import cffsubr.__main__
 import fontmake.instantiator
 import fontTools.designspaceLib
+from fontTools.feaLib.builder import addOpenTypeFeaturesFromString
+import fontTools.misc.transform
+import fontTools.subset
+from fontTools.otlLib.builder import buildStatTable
+from fontTools.otlLib.maxContextCalc import maxCtxFont
 import fontTools.ttLib
 import fontTools.ttLib.tables._g_l_y_f as _g_l_y_f
+import fontTools.ttLib.tables.O_S_2f_2 as O_S_2f_2
+import fontTools.ttLib.woff2
+from fontTools.ttLib.reorderGlyphs import reorderGlyphs
+from fontTools.varLib import FEAVAR_FEATURETAG_LIB_KEY, instancer
+from fontTools.varLib.featureVars import addFeatureVariations
+import pathops
 import psautohint.__main__
-from gftools.stat import gen_stat_tables_from_config
+import psautohint.autohint
 import yaml
 import ufo2ft
+import ufo2ft.featureCompiler
+import ufo2ft.preProcessor
+from ufo2ft.filters.removeOverlaps import RemoveOverlapsFilter
+from ufo2ft.postProcessor import PostProcessor
+from ufo2ft.util import decomposeCompositeGlyph, makeOfficialGlyphOrder
+from ufo2ft.fontInfoData import getAttrWithFallback, normalizeStringForPostscript
 import ufoLib2
+import ufoLib2.objects
 import vttLib
 import vttLib.transfer
-from vttmisc import tsi1, tsic
+from vttmisc import tsic
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore
 
 VERSION_YEAR_MONTH = 2407
 VERSION_DAY = 24
@@ -37,6 +92,124 @@ VTT_DATA_FILE = INPUT_DIR / "vtt_data" / "CascadiaCode_VTT.ttf"
 ITALIC_VTT_DATA_FILE = INPUT_DIR / "vtt_data" / "CascadiaCodeItalic_VTT.ttf"
 FEATURES_DIR = INPUT_DIR / "features"
 NERDFONTS_DIR = INPUT_DIR / "nerdfonts"
+# The glyphs of the processed Nerd Fonts UFOs in one memory-mappable file,
+# written by update_glyph_pack whenever a UFO no longer matches it:
+#   header   magic, version, number of points, length of the metadata
+#   metadata binary plist, zero-padded to a multiple of 4 bytes: per UFO its
+#            name, hash_path and glyphs, each with its width, unicodes, note,
+#            lib, components, anchors and the number of points of every contour
+#   coords   little-endian int32 x, y pairs of all points in glyph order
+#   types    one byte per point: index into GLYPH_PACK_POINT_TYPES, +0x80 if smooth
+GLYPH_PACK_FILE = OUTPUT_DIR / "nerdfonts.glyphpack"
+GLYPH_PACK_MAGIC = b"CCGLYPK\0"
+GLYPH_PACK_VERSION = 1
+GLYPH_PACK_HEADER = struct.Struct("<8sIII")
+GLYPH_PACK_POINT_TYPES = [None, "move", "line", "offcurve", "curve", "qcurve"]
+CACHE_DIR = OUTPUT_DIR / "cache"
+# Brotli's best and slowest setting, lower ones trade size for speed.
+WOFF2_QUALITY = 11
+# Distributions whose version changes what ends up in the compiled binaries.
+CACHE_TOOLS = [
+    "fontmake",
+    "fonttools",
+    "skia-pathops",
+    "ufo2ft",
+    "ufoLib2",
+    "vttLib",
+    "vttmisc",
+]
+
+# Instrumentation
+# ****************************************************************
+
+# Measurements of the steps run in this process since the last job started,
+# handed back to the main process along with the job's result.
+STEP_RECORDS: List[Dict[str, Any]] = []
+CURRENT_JOB = ""
+# Build cache entries restored by the current job so far.
+CACHE_HITS = 0
+PROFILE_DIR: Optional[Path] = None
+_step_depth = 0
+
+
+def reset_peak_rss() -> None:
+    # Linux can reset the high-water mark, elsewhere it covers the process lifetime.
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss() -> Optional[int]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def cpu_time() -> float:
+    # Includes finished subprocesses such as ttfautohint.
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+@contextlib.contextmanager
+def measure(step: str) -> Iterator[None]:
+    """Record wall time, CPU time and peak RSS of a step of the current job.
+
+    Steps can nest. A nested step's peak RSS covers everything since the
+    outermost step started, and only the outermost step is profiled.
+    """
+    global _step_depth
+    if _step_depth == 0:
+        reset_peak_rss()
+    hits = CACHE_HITS
+    profiler = None
+    if PROFILE_DIR is not None and _step_depth == 0:
+        profiler = cProfile.Profile()
+    wall = time.perf_counter()
+    cpu = cpu_time()
+    _step_depth += 1
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        _step_depth -= 1
+        STEP_RECORDS.append(
+            {
+                "job": CURRENT_JOB,
+                "step": step,
+                "wall": time.perf_counter() - wall,
+                "cpu": cpu_time() - cpu,
+                "peak_rss": peak_rss(),
+                "cached": CACHE_HITS > hits,
+            }
+        )
+        if profiler is not None:
+            PROFILE_DIR.mkdir(exist_ok=True, parents=True)
+            file_name = f"{CURRENT_JOB} {step} {len(STEP_RECORDS)}.prof"
+            profiler.dump_stats(PROFILE_DIR / file_name.replace(" ", "_").replace("/", "_"))
+
+
+def instrumented(function: Callable[..., Any]) -> Callable[..., Any]:
+    @functools.wraps(function)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with measure(function.__name__):
+            return function(*args, **kwargs)
+
+    return wrapper
+
 
 # Font modifications
 # ****************************************************************
@@ -50,22 +223,271 @@ def step_set_font_name(name: str, source: ufoLib2.Font) -> None:
         source.info.styleMapFamilyName = source.info.styleMapFamilyName.replace("Cascadia Code", name)
 
 
-def step_merge_glyphs_from_ufo(path: Path, instance: ufoLib2.Font) -> None:
-    unicodes = []
-    for glyph in instance:
-        unicodes.append(glyph.unicode)
-    ufo = ufoLib2.Font.open(path)
-    for glyph in ufo:
-        if glyph.unicode:
-            if glyph.unicode not in unicodes:
+@functools.lru_cache(maxsize=None)
+def open_donor_ufo(path: Path) -> ufoLib2.Font:
+    # Donors are read once per job and their glyphs copied into each master.
+    return ufoLib2.Font.open(path, lazy=False)
+
+
+class GlyphPackFont(NamedTuple):
+    hash: str
+    glyphs: List[Dict[str, Any]]
+    coords: Sequence[int]
+    types: Sequence[int]
+
+
+@functools.lru_cache(maxsize=None)
+def open_glyph_pack(path: Path) -> Dict[str, GlyphPackFont]:
+    if not path.exists():
+        return {}
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, num_points, metadata_length = GLYPH_PACK_HEADER.unpack_from(data)
+    if magic != GLYPH_PACK_MAGIC or version != GLYPH_PACK_VERSION:
+        print(f"[Glyph pack] Ignoring {path}, it was written by another version of build.py")
+        return {}
+    start = GLYPH_PACK_HEADER.size
+    fonts = plistlib.loads(data[start : start + metadata_length])
+    start += metadata_length + -(start + metadata_length) % 4
+    coords: Sequence[int] = memoryview(data)[start : start + 8 * num_points].cast("i")
+    if sys.byteorder != "little":
+        coords = array("i", coords.tobytes())
+        coords.byteswap()
+    types = memoryview(data)[start + 8 * num_points : start + 9 * num_points]
+
+    pack = {}
+    point = 0
+    for font in fonts:
+        # Each font gets views starting at its own first point.
+        num_font_points = sum(sum(g["contours"]) for g in font["glyphs"])
+        pack[font["name"]] = GlyphPackFont(
+            font["hash"],
+            font["glyphs"],
+            coords[2 * point : 2 * (point + num_font_points)],
+            types[point : point + num_font_points],
+        )
+        point += num_font_points
+    return pack
+
+
+def write_glyph_pack(paths: Sequence[Path], pack_path: Path) -> None:
+    fonts = []
+    coords = array("i")
+    types = bytearray()
+    for path in paths:
+        glyphs = []
+        for glyph in ufoLib2.Font.open(path, lazy=False):
+            if glyph.guidelines or glyph.image.fileName:
+                raise ValueError(
+                    f"{path.name}: {glyph.name} has guidelines or an image, which the glyph pack can't store"
+                )
+            contours = []
+            for contour in glyph.contours:
+                contours.append(len(contour))
+                for point in contour:
+                    if point.name or point.identifier or contour.identifier:
+                        raise ValueError(
+                            f"{path.name}: {glyph.name} has named points, which the glyph pack can't store"
+                        )
+                    if not (float(point.x).is_integer() and float(point.y).is_integer()):
+                        raise ValueError(f"{path.name}: {glyph.name} has unrounded points")
+                    coords.append(int(point.x))
+                    coords.append(int(point.y))
+                    types.append(
+                        GLYPH_PACK_POINT_TYPES.index(point.type) | (0x80 if point.smooth else 0)
+                    )
+            record: Dict[str, Any] = {"name": glyph.name, "width": glyph.width, "contours": contours}
+            if glyph.height:
+                record["height"] = glyph.height
+            if glyph.unicodes:
+                record["unicodes"] = glyph.unicodes
+            if glyph.note is not None:
+                record["note"] = glyph.note
+            if glyph.lib:
+                record["lib"] = glyph.lib
+            if glyph.components:
+                record["components"] = [
+                    [c.baseGlyph, list(c.transformation)] for c in glyph.components
+                ]
+            if glyph.anchors:
+                record["anchors"] = [[a.name, a.x, a.y] for a in glyph.anchors]
+            glyphs.append(record)
+        fonts.append({"name": path.name, "hash": hash_path(path), "glyphs": glyphs})
+
+    metadata = plistlib.dumps(fonts, fmt=plistlib.FMT_BINARY, sort_keys=True)
+    if coords.itemsize != 4:
+        raise RuntimeError("array('i') is not 32 bits wide on this platform")
+    if sys.byteorder != "little":
+        coords.byteswap()
+    pack_path.parent.mkdir(exist_ok=True, parents=True)
+    # Write next to the pack and swap it in, so that a crashed build never
+    # leaves a truncated pack behind.
+    with tempfile.NamedTemporaryFile(dir=pack_path.parent, delete=False) as f:
+        f.write(GLYPH_PACK_HEADER.pack(GLYPH_PACK_MAGIC, GLYPH_PACK_VERSION, len(types), len(metadata)))
+        f.write(metadata)
+        # Pad so that the coordinates start 4-byte aligned when memory-mapped.
+        f.write(b"\0" * (-(GLYPH_PACK_HEADER.size + len(metadata)) % 4))
+        f.write(coords.tobytes())
+        f.write(types)
+    os.replace(f.name, pack_path)
+
+
+def update_glyph_pack(paths: Optional[Sequence[Path]] = None) -> None:
+    """Rewrite the glyph pack unless it holds exactly the current Nerd Fonts UFOs."""
+    if paths is None:
+        paths = processed_nerdfonts_paths()
+    pack = open_glyph_pack(GLYPH_PACK_FILE)
+    if sorted(pack) == sorted(path.name for path in paths) and all(
+        pack[path.name].hash == hash_path(path) for path in paths
+    ):
+        return
+    print(f"[Glyph pack] Writing {GLYPH_PACK_FILE}")
+    # Unmap the old pack before replacing it.
+    del pack
+    open_glyph_pack.cache_clear()
+    write_glyph_pack(paths, GLYPH_PACK_FILE)
+
+
+def glyph_pack_glyphs(font: GlyphPackFont) -> Iterator[ufoLib2.objects.Glyph]:
+    O = ufoLib2.objects
+    point = 0
+    for record in font.glyphs:
+        contours = []
+        for num_points in record["contours"]:
+            points = []
+            for i in range(point, point + num_points):
+                kind = font.types[i]
+                points.append(
+                    O.Point(
+                        font.coords[2 * i],
+                        font.coords[2 * i + 1],
+                        GLYPH_PACK_POINT_TYPES[kind & 0x7F],
+                        bool(kind & 0x80),
+                    )
+                )
+            contours.append(O.Contour(points))
+            point += num_points
+        yield O.Glyph(
+            record["name"],
+            width=record["width"],
+            height=record.get("height", 0),
+            unicodes=record.get("unicodes", []),
+            lib=record.get("lib", {}),
+            note=record.get("note"),
+            anchors=[O.Anchor(x, y, name) for name, x, y in record.get("anchors", [])],
+            components=[
+                O.Component(baseGlyph, fontTools.misc.transform.Transform(*transformation))
+                for baseGlyph, transformation in record.get("components", [])
+            ],
+            contours=contours,
+        )
+
+
+def donor_glyphs(path: Path) -> Iterator[ufoLib2.objects.Glyph]:
+    """Yield new copies of the glyphs of a donor UFO.
+
+    They come from the glyph pack when it holds an up to date copy of the UFO,
+    which is much faster than parsing its .glif files.
+    """
+    font = open_glyph_pack(GLYPH_PACK_FILE).get(path.name)
+    if font is not None and font.hash == hash_path(path):
+        yield from glyph_pack_glyphs(font)
+    else:
+        if font is not None:
+            print(f"[Glyph pack] {path.name} changed since the pack was written, reading the UFO")
+        for glyph in open_donor_ufo(path):
+            yield copy_glyph(glyph, glyph.name)
+
+
+def copy_glyph(glyph: ufoLib2.objects.Glyph, name: str) -> ufoLib2.objects.Glyph:
+    # Rebuilding the glyph field by field is an order of magnitude faster than
+    # Glyph.copy(), which goes through copy.deepcopy.
+    O = ufoLib2.objects
+    return O.Glyph(
+        name,
+        width=glyph.width,
+        height=glyph.height,
+        unicodes=list(glyph.unicodes),
+        image=O.Image(glyph.image.fileName, glyph.image.transformation, glyph.image.color),
+        lib=copy.deepcopy(glyph.lib),
+        note=glyph.note,
+        anchors=[O.Anchor(a.x, a.y, a.name, a.color, a.identifier) for a in glyph.anchors],
+        components=[
+            O.Component(c.baseGlyph, c.transformation, c.identifier)
+            for c in glyph.components
+        ],
+        contours=[
+            O.Contour(
+                [O.Point(p.x, p.y, p.type, p.smooth, p.name, p.identifier) for p in c],
+                c.identifier,
+            )
+            for c in glyph.contours
+        ],
+        guidelines=[
+            O.Guideline(g.x, g.y, g.angle, g.name, g.color, g.identifier)
+            for g in glyph.guidelines
+        ],
+    )
+
+
+def font_cmap(font: ufoLib2.Font) -> Dict[int, str]:
+    """Map the codepoints of the default layer's glyphs to their names, first glyph wins.
+
+    Of a font read from disk, the codepoints are read from the unicode
+    elements of the .glif files, so that the compiler is the first to parse
+    outlines. That assumes that the glyphs it has read since are unchanged,
+    which holds for the masters up to the merge. Glyphs that are not on disk
+    are asked for their codepoints.
+    """
+    layer = font.layers.defaultLayer
+    unicodes: Dict[str, List[int]] = {}
+    if font.reader is not None and layer.name == font.reader.getDefaultLayerName():
+        glyph_set = font.reader.getGlyphSet()
+        unicodes = glyph_set.getUnicodes([name for name in layer.keys() if name in glyph_set])
+    cmap: Dict[int, str] = {}
+    for name in layer.keys():
+        for unicode in unicodes[name] if name in unicodes else layer[name].unicodes:
+            cmap.setdefault(unicode, name)
+    return cmap
+
+
+def step_merge_glyphs_from_ufos(
+    paths: Sequence[Path], instance: ufoLib2.Font, label: str
+) -> None:
+    layer = instance.layers.defaultLayer
+    # Index every codepoint of every glyph, not just the first one, so that
+    # lookups stay O(1) and secondary codepoints can't end up mapped twice.
+    cmap = font_cmap(instance)
+
+    for path in paths:
+        conflicts = []
+        for glyph in donor_glyphs(path):
+            if glyph.unicodes:
                 newName = str(hex(glyph.unicode)).upper().replace("0X","uni")
-                instance.layers.defaultLayer.insertGlyph(ufo[glyph.name],newName, overwrite=False, copy=False)
-        else:
-            instance.addGlyph(ufo[glyph.name])
+                if glyph.unicode in cmap or newName in layer:
+                    conflicts.append(glyph.name)
+                    continue
+                unicodes = [u for u in glyph.unicodes if u not in cmap]
+                if unicodes != glyph.unicodes:
+                    conflicts.append(glyph.name)
+                glyph.unicodes = unicodes
+                layer.insertGlyph(glyph, newName, overwrite=False, copy=False)
+                for unicode in unicodes:
+                    cmap[unicode] = newName
+            else:
+                if glyph.name in layer:
+                    conflicts.append(glyph.name)
+                    continue
+                layer.insertGlyph(glyph, overwrite=False, copy=False)
+        if conflicts:
+            print(
+                f"[{label}] {len(conflicts)} glyphs from {path.name} clash with "
+                f"existing codepoints or names, keeping the existing ones: "
+                f"{', '.join(conflicts[:5])}" + (", ..." if len(conflicts) > 5 else "")
+            )
 
 
-def step_set_feature_file(path: Path, name: str, instance: ufoLib2.Font) -> None:
-    featureSet = ""
+def feature_files(path: Path, name: str) -> List[Path]:
     if "Italic" in name: #until I can come up with a more elegent solution, this'll do. 
         featureList = [
             "header_italic", # adds definitions, language systems
@@ -108,15 +530,23 @@ def step_set_feature_file(path: Path, name: str, instance: ufoLib2.Font) -> None
             "rlig",
             ]
 
+    files = []
     for item in featureList:
         if "PL" in name and item == "rclt":
-            featureSet += Path(path / str("rclt_PL.fea")).read_text()
+            files.append(path / "rclt_PL.fea")
         elif "NF" in name and item == "rclt":
-            featureSet += Path(path / str("rclt_PL.fea")).read_text()
+            files.append(path / "rclt_PL.fea")
         elif "Mono" in name and "calt" in item:
-            featureSet += Path(path / str(item+"_mono.fea")).read_text() #both Italic and Regular can use same mono
+            files.append(path / str(item+"_mono.fea")) #both Italic and Regular can use same mono
         else:
-            featureSet += Path(path / str(item+".fea")).read_text()
+            files.append(path / str(item+".fea"))
+    return files
+
+
+def step_set_feature_file(path: Path, name: str, instance: ufoLib2.Font) -> None:
+    featureSet = ""
+    for file in feature_files(path, name):
+        featureSet += file.read_text()
     instance.features.text = featureSet   
 
 
@@ -142,6 +572,23 @@ def set_font_metaData(font: ufoLib2.Font) -> None:
     ]
 
 
+@functools.lru_cache(maxsize=None)
+def stat_config() -> Dict[str, Any]:
+    with open(INPUT_DIR/"stat.yaml") as f:
+        return yaml.load(f, Loader=yaml.SafeLoader)
+
+
+def add_stat_table(varFont: fontTools.ttLib.TTFont, file_name: str) -> None:
+    config = stat_config()
+    if file_name not in config:
+        print(f"[{file_name}] No STAT configuration, skipping")
+        return
+    print(f"[{file_name}] Adding STAT table")
+    # What gen_stat_tables_from_config does for a config by file name, but
+    # without needing the font to have been read from that file.
+    buildStatTable(varFont, config[file_name])
+
+
 def set_overlap_flag(varfont: fontTools.ttLib.TTFont) -> fontTools.ttLib.TTFont:
     glyf = cast(_g_l_y_f.table__g_l_y_f, varfont["glyf"])
     for glyph_name in glyf.keys():
@@ -153,8 +600,32 @@ def set_overlap_flag(varfont: fontTools.ttLib.TTFont) -> fontTools.ttLib.TTFont:
             # Set OVERLAP_SIMPLE bit for simple glyphs
             glyph.flags[0] |= 0x40
 
+def processed_nerdfonts_paths() -> List[Path]:
+    return sorted(Path(NERDFONTS_DIR/"full"/"processed").glob("*.ufo"))
+
+
+def merged_ufo_paths(name: str) -> List[Path]:
+    paths = []
+    if "PL" in name or "NF" in name:
+        paths.append(NERDFONTS_DIR / "NerdfontsPL-Regular.ufo")
+    if "NF" in name:
+        paths.extend(processed_nerdfonts_paths())
+    return paths
+
+
+@instrumented
+def step_merge_glyphs(name: str, font: ufoLib2.Font, label: str) -> None:
+    paths = merged_ufo_paths(name)
+    if paths:
+        print(f"[{label}] Merging {'NF' if 'NF' in name else 'PL'} glyphs")
+        step_merge_glyphs_from_ufos(paths, font, label)
+
+
+@instrumented
 def prepare_fonts(
-    designspace: fontTools.designspaceLib.DesignSpaceDocument, name: str
+    designspace: fontTools.designspaceLib.DesignSpaceDocument,
+    name: str,
+    merge_glyphs: bool = True,
 ) -> None:
     designspace.loadSourceFonts(ufoLib2.Font.open)
     for source in designspace.sources:
@@ -164,19 +635,6 @@ def prepare_fonts(
         if "PL" in name or "NF" in name or "Mono" in name:
             step_set_font_name(name, source.font)
 
-        if "PL" in name or "NF" in name:
-            print(f"[{name} {source.styleName}] Merging PL glyphs")
-            step_merge_glyphs_from_ufo(
-                NERDFONTS_DIR / "NerdfontsPL-Regular.ufo", source.font
-            )
-
-        if "NF" in name:
-            print(f"[{name} {source.styleName}] Merging NF glyphs")
-            for ufo in Path(NERDFONTS_DIR/"full"/"processed").glob("*.ufo"):
-                step_merge_glyphs_from_ufo(
-                    ufo, source.font
-                )
-
         set_font_metaData(source.font)
     for instance in designspace.instances:
         instance.name = instance.name.replace("Cascadia Code", name)
@@ -184,13 +642,216 @@ def prepare_fonts(
         if instance.styleMapFamilyName:
             instance.styleMapFamilyName = instance.styleMapFamilyName.replace("Cascadia Code", name)
 
+    if merge_glyphs:
+        merge_source_glyphs(designspace, name)
+
 
-def to_woff2(source_path: Path, target_path: Path) -> None:
+def merge_source_glyphs(
+    designspace: fontTools.designspaceLib.DesignSpaceDocument, name: str
+) -> None:
+    for source in designspace.sources:
+        step_merge_glyphs(name, source.font, f"{name} {source.styleName}")
+
+
+@instrumented
+def save_prepared_fonts(
+    designspace: fontTools.designspaceLib.DesignSpaceDocument, name: str, path: Path
+) -> Path:
+    """Prepare a family's masters, short of merging glyphs into them, for
+    the variable font and the static instances to both start from."""
+    prepare_fonts(designspace, name, merge_glyphs=False)
+    print(f"[{name}] Saving prepared masters")
+    # Pickling loads every glyph and is much faster to read back than the UFO XML.
+    with open(path, "wb") as f:
+        pickle.dump(designspace, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def load_prepared_fonts(
+    designspace: fontTools.designspaceLib.DesignSpaceDocument,
+    name: str,
+    prepared: Optional[Path] = None,
+    merge_glyphs: bool = True,
+) -> fontTools.designspaceLib.DesignSpaceDocument:
+    """Prepare the masters, or read them back from save_prepared_fonts."""
+    if prepared is None:
+        prepare_fonts(designspace, name, merge_glyphs)
+        return designspace
+    with measure("load_prepared_fonts"), open(prepared, "rb") as f:
+        designspace = pickle.load(f)
+    if merge_glyphs:
+        merge_source_glyphs(designspace, name)
+    return designspace
+
+
+class QualityBrotli:
+    """Stands in for the brotli module, compressing at a given quality."""
+
+    def __init__(self, module: Any, quality: int) -> None:
+        self.module = module
+        self.quality = quality
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.module, name)
+
+    def compress(self, data: bytes, **kwargs: Any) -> bytes:
+        return self.module.compress(data, quality=self.quality, **kwargs)
+
+
+@contextlib.contextmanager
+def brotli_quality(quality: int) -> Iterator[None]:
+    brotli = fontTools.ttLib.woff2.brotli
+    fontTools.ttLib.woff2.brotli = QualityBrotli(brotli, quality)
+    try:
+        yield
+    finally:
+        fontTools.ttLib.woff2.brotli = brotli
+
+
+@instrumented
+def to_woff2(
+    source_path: Path,
+    target_path: Path,
+    quality: int = WOFF2_QUALITY,
+    cache_dir: Optional[Path] = None,
+) -> None:
+    data = source_path.read_bytes()
+    key = woff2_cache_key(data, target_path, quality)
+    if cache_restore(cache_dir, key):
+        return
     print(f"[WOFF2] Compressing {source_path} to {target_path}")
-    font = fontTools.ttLib.TTFont(source_path)
-    font.flavor = "woff2"
     target_path.parent.mkdir(exist_ok=True, parents=True)
-    font.save(target_path)
+    # The TTF is read back from disk, as the job that compiled it ran in
+    # another process. woff2.compress takes its bytes directly: only glyf
+    # and loca are decompiled for the WOFF2 transform, every other table is
+    # copied as it is instead of going through a TTFont.
+    with brotli_quality(quality), measure("woff2.compress"):
+        fontTools.ttLib.woff2.compress(io.BytesIO(data), os.fspath(target_path))
+    cache_store(cache_dir, key, [target_path])
+
+
+# Build cache
+# ****************************************************************
+
+
+@functools.lru_cache(maxsize=None)
+def hash_path(path: Path) -> str:
+    """Hash a file, or a directory such as a UFO by its relative paths and contents."""
+    digest = hashlib.sha256()
+    if path.is_dir():
+        for file in sorted(p for p in path.rglob("*") if p.is_file()):
+            digest.update(file.relative_to(path).as_posix().encode() + b"\0")
+            digest.update(file.read_bytes() + b"\0")
+    else:
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def cache_key(
+    designspace: fontTools.designspaceLib.DesignSpaceDocument,
+    name: str,
+    extra: Sequence[str] = (),
+) -> str:
+    inputs = {
+        "build.py": hash_path(Path(__file__)),
+        "version": [VERSION_YEAR_MONTH, VERSION_DAY],
+        "tools": {tool: metadata.version(tool) for tool in CACHE_TOOLS},
+        "name": name,
+        "extra": list(extra),
+        "designspace": hash_path(Path(designspace.path)),
+        "sources": [hash_path(Path(source.path)) for source in designspace.sources],
+        "features": [hash_path(path) for path in feature_files(FEATURES_DIR, name)],
+        "merged": [hash_path(path) for path in merged_ufo_paths(name)],
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def variable_cache_key(
+    designspace: fontTools.designspaceLib.DesignSpaceDocument,
+    name: str,
+    vtt_compile: bool,
+) -> str:
+    vtt_file = ITALIC_VTT_DATA_FILE if "Italic" in name else VTT_DATA_FILE
+    return cache_key(
+        designspace,
+        name,
+        ["variable", str(vtt_compile), hash_path(vtt_file), hash_path(INPUT_DIR / "stat.yaml")],
+    )
+
+
+def static_cache_key(
+    designspace: fontTools.designspaceLib.DesignSpaceDocument,
+    instance_descriptor: fontTools.designspaceLib.InstanceDescriptor,
+    name: str,
+    formats: Sequence[str] = ("ttf", "otf"),
+) -> str:
+    return cache_key(designspace, name, ["static", instance_descriptor.name, *formats])
+
+
+def woff2_cache_key(data: bytes, target_path: Path, quality: int) -> str:
+    inputs = {
+        "ttf": hashlib.sha256(data).hexdigest(),
+        "target": target_path.as_posix(),
+        "quality": quality,
+        "fonttools": metadata.version("fonttools"),
+        "brotli": getattr(fontTools.ttLib.woff2.brotli, "__version__", None),
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def postprocess_cache_key(
+    data: bytes, target_path: Path, step: str, tools: Dict[str, Any]
+) -> str:
+    """Key a post-processing step by the font it starts from and the tools it runs."""
+    inputs = {
+        "build.py": hash_path(Path(__file__)),
+        "font": hashlib.sha256(data).hexdigest(),
+        "target": target_path.as_posix(),
+        "step": step,
+        "tools": tools,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def cache_contains(cache_dir: Optional[Path], key: str) -> bool:
+    return cache_dir is not None and (cache_dir / key / "manifest.json").exists()
+
+
+def cache_restore(cache_dir: Optional[Path], key: str) -> Optional[List[Path]]:
+    global CACHE_HITS
+    if not cache_contains(cache_dir, key):
+        return None
+    CACHE_HITS += 1
+    targets = []
+    for output in json.loads((cache_dir / key / "manifest.json").read_text()):
+        target = OUTPUT_DIR / output
+        target.parent.mkdir(exist_ok=True, parents=True)
+        shutil.copyfile(cache_dir / key / output, target)
+        print(f"[Cache] Reused {target}")
+        targets.append(target)
+    return targets
+
+
+def cache_store(cache_dir: Optional[Path], key: str, paths: Sequence[Path]) -> None:
+    if cache_dir is None:
+        return
+    cache_dir.mkdir(exist_ok=True, parents=True)
+    # Populate a scratch directory first so that a crashed or concurrent job
+    # never leaves a half-written entry behind.
+    scratch = Path(tempfile.mkdtemp(dir=cache_dir))
+    outputs = []
+    for path in paths:
+        output = path.relative_to(OUTPUT_DIR)
+        (scratch / output).parent.mkdir(exist_ok=True, parents=True)
+        shutil.copyfile(path, scratch / output)
+        outputs.append(output.as_posix())
+    (scratch / "manifest.json").write_text(json.dumps(outputs))
+    try:
+        os.rename(scratch, cache_dir / key)
+    except OSError:
+        # Another job stored the same entry first.
+        shutil.rmtree(scratch)
+
 
 # Build fonts
 # ****************************************************************
@@ -200,34 +861,389 @@ def build_font_variable(
     designspace: fontTools.designspaceLib.DesignSpaceDocument,
     name: str,
     vtt_compile: bool = True,
-) -> None:
-    prepare_fonts(designspace, name)
-    compile_variable_and_save(designspace, vtt_compile)
+    cache_dir: Optional[Path] = None,
+    mono: bool = False,
+    prepared: Optional[Path] = None,
+) -> List[Path]:
+    """Build a variable font, and with mono its Mono counterpart derived from it.
+
+    prepared is where save_prepared_fonts left the masters, if it ran.
+    """
+    keys = [variable_cache_key(designspace, n, vtt_compile) for n in family_names(name, mono)]
+    if all(cache_contains(cache_dir, key) for key in keys):
+        return [cast(List[Path], cache_restore(cache_dir, key))[0] for key in keys]
+
+    file_paths, _ = compile_variable_fonts(designspace, name, vtt_compile, mono, prepared)
+    for key, path in zip(keys, file_paths):
+        cache_store(cache_dir, key, [path])
+    return file_paths
+
+
+def build_font_variable_vtt_sources(
+    designspace: fontTools.designspaceLib.DesignSpaceDocument,
+    name: str,
+    mono: bool = False,
+    prepared: Optional[Path] = None,
+) -> Tuple[List[Path], List[str], Dict[str, str]]:
+    """Build a variable font like build_font_variable, leaving its VTT code to
+    compile_vtt_glyph_programs and compile_vtt_and_save.
+
+    Also returns the font's glyph order and TSI1 glyph programs, so that the
+    jobs compiling those don't have to read the font.
+    """
+    file_paths, glyph_order = compile_variable_fonts(designspace, name, False, mono, prepared)
+    vtt = load_vtt_data(ITALIC_VTT_DATA_FILE if "Italic" in name else VTT_DATA_FILE)
+    return file_paths, glyph_order, vtt_glyph_programs(vtt, glyph_order)
+
+
+def compile_variable_fonts(
+    designspace: fontTools.designspaceLib.DesignSpaceDocument,
+    name: str,
+    vtt_compile: bool,
+    mono: bool,
+    prepared: Optional[Path],
+) -> Tuple[List[Path], List[str]]:
+    designspace = load_prepared_fonts(designspace, name, prepared)
+    # The compile replaces the masters with the fonts compiled from them.
+    glyph_names = source_glyph_names(designspace.default.font)
+    file_path = compile_variable_and_save(designspace, vtt_compile)
+    file_paths = [file_path]
+    if mono:
+        file_paths.append(derive_mono_and_save(file_path, glyph_names, name, designspace))
+    return file_paths, list(glyph_names)
 
 
 def build_font_static(
     designspace: fontTools.designspaceLib.DesignSpaceDocument,
     instance_descriptor: fontTools.designspaceLib.InstanceDescriptor,
     name: str,
-) -> None:
-    prepare_fonts(designspace, name)
+    cache_dir: Optional[Path] = None,
+    formats: Sequence[str] = ("ttf", "otf"),
+    mono: bool = False,
+) -> List[Path]:
+    keys = [
+        static_cache_key(designspace, instance_descriptor, n, formats)
+        for n in family_names(name, mono)
+    ]
+    if all(cache_contains(cache_dir, key) for key in keys):
+        return [path for key in keys for path in cast(List[Path], cache_restore(cache_dir, key))]
+
+    instance = generate_static_instances(designspace, name, [instance_descriptor.styleName])[0]
+    return compile_static_instance_and_store(instance, name, cache_dir, keys, formats)
+
 
-    generator = fontmake.instantiator.Instantiator.from_designspace(designspace)
-    instance = generator.generate_instance(instance_descriptor)
+@instrumented
+def generate_static_instances(
+    designspace: fontTools.designspaceLib.DesignSpaceDocument,
+    name: str,
+    style_names: Sequence[str],
+    prepared: Optional[Path] = None,
+) -> List[ufoLib2.Font]:
+    """Interpolate some instances of a family, setting up the instantiator once."""
+    # The Powerline and Nerd Fonts glyphs are the same in every master, so
+    # interpolate the Cascadia outlines alone and merge them into the instance.
+    designspace = load_prepared_fonts(designspace, name, prepared, merge_glyphs=False)
+    with measure("Instantiator.from_designspace"):
+        generator = fontmake.instantiator.Instantiator.from_designspace(designspace)
+    instances = []
+    for style_name in style_names:
+        # prepare_fonts renamed the instances, so look them up by style.
+        instance_descriptor = next(
+            i for i in designspace.instances if i.styleName == style_name
+        )
+        with measure("Instantiator.generate_instance"):
+            instances.append(generator.generate_instance(instance_descriptor))
+    return instances
+
+
+@instrumented
+def save_static_instances(
+    designspace: fontTools.designspaceLib.DesignSpaceDocument,
+    name: str,
+    style_names: Sequence[str],
+    target_dir: Path,
+    prepared: Optional[Path] = None,
+) -> List[Path]:
+    instances = generate_static_instances(designspace, name, style_names, prepared)
+    print(f"[{name}] Saving {len(instances)} instances")
+    paths = []
+    for style_name, instance in zip(style_names, instances):
+        path = target_dir / f"{name} {style_name}.pickle"
+        # Much faster to read back than the UFO XML.
+        with open(path, "wb") as f:
+            pickle.dump(instance, f, protocol=pickle.HIGHEST_PROTOCOL)
+        paths.append(path)
+    return paths
+
+
+def compile_static_instance(
+    instance: ufoLib2.Font,
+    name: str,
+    formats: Sequence[str] = ("ttf", "otf"),
+    mono: bool = False,
+) -> List[List[Path]]:
+    """Compile an instance, and with mono derive its Mono counterpart.
+
+    Returns the paths of each font separately.
+    """
+    step_merge_glyphs(name, instance, f"{name} {instance.info.styleName}")
     instance.info.familyName = instance.info.familyName.replace(" Italic","")
     if instance.info.styleMapFamilyName:
         instance.info.styleMapFamilyName = instance.info.styleMapFamilyName.replace(" Italic","")
-    compile_static_and_save(instance, name.replace(" Italic",""))
+    glyph_names = source_glyph_names(instance)
+    file_paths = [compile_static_and_save(instance, name.replace(" Italic",""), formats)]
+    if mono:
+        file_paths.append(
+            [derive_mono_and_save(path, glyph_names, name) for path in file_paths[0]]
+        )
+    return file_paths
+
+
+def compile_static_instance_and_store(
+    instance: ufoLib2.Font,
+    name: str,
+    cache_dir: Optional[Path],
+    keys: Sequence[str],
+    formats: Sequence[str] = ("ttf", "otf"),
+) -> List[Path]:
+    """Compile an instance and store it in the cache by the first key, and its
+    Mono counterpart by the second, if there is one."""
+    file_paths = compile_static_instance(instance, name, formats, mono=len(keys) > 1)
+    for key, paths in zip(keys, file_paths):
+        cache_store(cache_dir, key, paths)
+    return [path for paths in file_paths for path in paths]
+
+
+def build_font_static_instance(
+    instance_path: Path,
+    name: str,
+    cache_dir: Optional[Path],
+    keys: Sequence[str],
+    formats: Sequence[str] = ("ttf", "otf"),
+) -> List[Path]:
+    """Finish an instance saved by save_static_instances."""
+    with open(instance_path, "rb") as f:
+        instance = pickle.load(f)
+    instance_path.unlink()
+    return compile_static_instance_and_store(instance, name, cache_dir, keys, formats)
 
 
 # Export fonts
 # ****************************************************************
 
+def shared_layout_compiler() -> Type[ufo2ft.featureCompiler.FeatureCompiler]:
+    """A FeatureCompiler class that reuses the layout tables it compiled first
+    for the fonts after, as long as they have the same glyph order.
+
+    Compiling an instance to TTF and then OTF with the same class only runs
+    the feature writers and feaLib once.
+    """
+    glyph_order: List[str] = []
+    tables: Dict[str, bytes] = {}
+
+    class SharedLayoutFeatureCompiler(ufo2ft.featureCompiler.FeatureCompiler):
+        def compile(self) -> fontTools.ttLib.TTFont:
+            if tables and self.ttFont.getGlyphOrder() == glyph_order:
+                for tag, data in tables.items():
+                    table = fontTools.ttLib.newTable(tag)
+                    table.decompile(data, self.ttFont)
+                    self.ttFont[tag] = table
+                # The only other thing feaLib touches, as the features have no table blocks.
+                if "OS/2" in self.ttFont:
+                    self.ttFont["OS/2"].usMaxContext = maxCtxFont(self.ttFont)
+                return self.ttFont
+
+            existing = set(self.ttFont.keys())
+            with measure("ufo2ft.compileFeatures"):
+                super().compile()
+            # A table block could change head, name etc., which is not replayed above.
+            if tables or re.search(
+                r"^\s*table\s+(?!GDEF\b|BASE\b)", self.ufo.features.text, re.MULTILINE
+            ):
+                return self.ttFont
+            glyph_order.extend(self.ttFont.getGlyphOrder())
+            tables.update(
+                (tag, self.ttFont[tag].compile(self.ttFont))
+                for tag in self.ttFont.keys()
+                if tag not in existing and tag != "GlyphOrder"
+            )
+            return self.ttFont
+
+    return SharedLayoutFeatureCompiler
+
+
+def outline_key(contours: List[ufoLib2.objects.Contour]) -> bytes:
+    digest = hashlib.sha256()
+    for contour in contours:
+        digest.update(repr([(p.x, p.y, p.type) for p in contour.points]).encode())
+        digest.update(b"\0")
+    return digest.digest()
+
+
+class CachedRemoveOverlapsFilter(RemoveOverlapsFilter):
+    """A RemoveOverlapsFilter that reuses the union of outlines it has seen.
+
+    The cache lives as long as the filter, which remove_overlaps creates for
+    one instance. So it only hits for outlines that repeat within an
+    instance: identical alternates, and composites whose decomposed outline
+    is that of another glyph.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # Overlap-free outlines by outline_key(), as the points of each contour.
+        self.outlines: Dict[bytes, List[List[Tuple[float, float, Optional[str], bool]]]] = {}
+        self.hits = 0
+
+    def filter(self, glyph):
+        if not len(glyph):
+            return False
+
+        contours = list(glyph)
+        key = outline_key(contours)
+        cached = self.outlines.get(key)
+        glyph.clearContours()
+        if cached is None:
+            try:
+                self.union(contours, glyph.getPen())
+            except self.Error as e:
+                # Reported under ufo2ft's logger, like RemoveOverlapsFilter does.
+                logging.getLogger(RemoveOverlapsFilter.__module__).error(
+                    "Failed to remove overlaps for %s: %r", glyph.name, e
+                )
+                raise
+            self.outlines[key] = [
+                [(p.x, p.y, p.type, p.smooth) for p in contour.points] for contour in glyph
+            ]
+        else:
+            self.hits += 1
+            glyph.contours.extend(
+                ufoLib2.objects.Contour([ufoLib2.objects.Point(*p) for p in points])
+                for points in cached
+            )
+        return True
+
+
+def remove_overlaps(instance: ufoLib2.Font) -> Dict[str, List[ufoLib2.objects.Contour]]:
+    """Remove overlaps from the instance in place, once for both outline formats.
 
+    Runs the same filters in the same order as compileTTF would up to overlap
+    removal: the UFO's own filters, then decomposing glyphs that mix contours
+    and components. Returns the outlines of the remaining composites decomposed
+    and without overlaps, for CFF, where compileOTF would decompose them from
+    the outlines before overlap removal.
+    """
+    glyph_set = ufo2ft.preProcessor.TTFPreProcessor(
+        instance,
+        inplace=True,
+        skipExportGlyphs=instance.lib.get("public.skipExportGlyphs", []),
+        convertCubics=False,
+        reverseDirection=False,
+    ).process()
+    overlaps_filter = CachedRemoveOverlapsFilter(backend="pathops")
+    decomposed = {}
+    for name, glyph in glyph_set.items():
+        if glyph.components:
+            outline = ufoLib2.objects.Glyph(name, components=list(glyph.components))
+            decomposeCompositeGlyph(outline, glyph_set)
+            overlaps_filter.filter(outline)
+            decomposed[name] = outline.contours
+    overlaps_filter(instance, glyph_set)
+    unions = len(overlaps_filter.outlines) + overlaps_filter.hits
+    print(
+        f"[{instance.info.familyName} {instance.info.styleName}] Reused "
+        f"{overlaps_filter.hits} of {unions} overlap-free outlines"
+    )
+    return decomposed
+
+
+VTT_TABLES = ["TSI0", "TSI1", "TSI2", "TSI3", "TSI5", "TSIC", "maxp"]
+
+
+class VTTData(NamedTuple):
+    glyph_order: List[str]
+    tables: Dict[str, Any]
+    # Per TSI1 glyph program its first line, for warnings, and its text as
+    # vttmisc's tsi1.fixOFFSET writes it, cut up around the glyph indices of
+    # its OFFSET commands, along with those indices and how they are written.
+    programs: Dict[str, Tuple[str, List[str], List[Tuple[int, str]]]]
+
+
+# Decompiled VTT sources by path. The build loads them before starting the
+# pool so that the workers inherit them instead of each parsing the TSI tables
+# again for every variable font.
+VTT_DATA: Dict[Path, VTTData] = {}
+
+
+def load_vtt_data(path: Path) -> VTTData:
+    if path in VTT_DATA:
+        return VTT_DATA[path]
+    font = fontTools.ttLib.TTFont(path)
+    tables = {tag: font[tag] for tag in VTT_TABLES}
+    programs = {}
+    for name, program in tables["TSI1"].glyphPrograms.items():
+        lines = program.splitlines()
+        pieces = [""]
+        indices = []
+        for line in lines:
+            pieces[-1] += "\n"
+            parts = line.split(", ")
+            if "OFFSET" in line and len(parts) > 1:
+                try:
+                    indices.append((int(parts[1]), parts[1]))
+                except ValueError:
+                    pass
+                else:
+                    pieces[-1] += parts[0] + ", "
+                    pieces.append(", ".join([""] + parts[2:]))
+                    continue
+            pieces[-1] += line
+        programs[name] = (lines[0] if lines else "", pieces, indices)
+    VTT_DATA[path] = VTTData(font.getGlyphOrder(), tables, programs)
+    return VTT_DATA[path]
+
+
+def merge_vtt_tables(varFont: fontTools.ttLib.TTFont, vtt: VTTData) -> None:
+    for tag, table in vtt.tables.items():
+        varFont[tag] = copy.deepcopy(table)
+    glyph_order = varFont.getGlyphOrder()
+    if glyph_order != vtt.glyph_order:
+        varFont["TSI1"].glyphPrograms = vtt_glyph_programs(vtt, glyph_order)
+
+
+def vtt_glyph_programs(vtt: VTTData, glyph_order: List[str]) -> Dict[str, str]:
+    """The TSI1 glyph programs of a VTT source, for a font with this glyph order."""
+    if glyph_order == vtt.glyph_order:
+        return dict(vtt.tables["TSI1"].glyphPrograms)
+    # This corrects the OFFSET[R] commands in TSI1 like vttmisc's
+    # tsi1.fixOFFSET, with the same output, but by filling in the glyph
+    # indices of programs cut up beforehand, looked up in a remap table.
+    new_index: Dict[str, int] = {}
+    for index, name in enumerate(glyph_order):
+        new_index.setdefault(name, index)
+    remap = [new_index.get(name) for name in vtt.glyph_order]
+    glyph_programs = {}
+    for name, (first_line, pieces, indices) in vtt.programs.items():
+        text = [pieces[0]]
+        for (old_index, token), piece in zip(indices, pieces[1:]):
+            try:
+                glyph_index = remap[old_index]
+            except IndexError:
+                glyph_index = None
+            else:
+                if glyph_index is None:
+                    print(f"{vtt.glyph_order[old_index]} not in new version. Please check {first_line}")
+            text.append(token if glyph_index is None else str(glyph_index))
+            text.append(piece)
+        glyph_programs[name] = "".join(text)
+    return glyph_programs
+
+
+@instrumented
 def compile_variable_and_save(
     designspace: fontTools.designspaceLib.DesignSpaceDocument,
     vtt_compile: bool = True,
-) -> None:
+) -> Path:
     
     if "Italic" in designspace.default.font.info.familyName: #Some weird stuff happens with Italics
         designspace.default.font.info.familyName = designspace.default.font.info.familyName.replace(" Italic", "")
@@ -240,28 +1256,21 @@ def compile_variable_and_save(
     file_path: Path = (OUTPUT_TTF_DIR / file_stem).with_suffix(".ttf")
 
     print(f"[{familyName} {styleName}] Compiling")
-    varFont = ufo2ft.compileVariableTTF(designspace, inplace=True)
+    with measure("ufo2ft.compileVariableTTF"):
+        varFont = ufo2ft.compileVariableTTF(designspace, inplace=True)
 
     print(f"[{familyName} {styleName}] Merging VTT")
 
-    if "Italic" in styleName:
-        font_vtt = fontTools.ttLib.TTFont(ITALIC_VTT_DATA_FILE)
-    else:
-        font_vtt = fontTools.ttLib.TTFont(VTT_DATA_FILE)
-    
-
-    for table in ["TSI0", "TSI1", "TSI2", "TSI3", "TSI5", "TSIC", "maxp"]:
-        varFont[table] = fontTools.ttLib.newTable(table)
-        varFont[table] = font_vtt[table]
-
-    # this will correct the OFFSET[R] commands in TSI1
-    if font_vtt.getGlyphOrder() != varFont.getGlyphOrder():
-        tsi1.fixOFFSET(varFont, font_vtt)
-        pass
+    with measure("merge_vtt_tables"):
+        if "Italic" in styleName:
+            merge_vtt_tables(varFont, load_vtt_data(ITALIC_VTT_DATA_FILE))
+        else:
+            merge_vtt_tables(varFont, load_vtt_data(VTT_DATA_FILE))
 
     if vtt_compile:
         print(f"[{familyName} {styleName}] Compiling VTT")
-        vttLib.compile_instructions(varFont, ship=True)
+        with measure("vttLib.compile_instructions"):
+            vttLib.compile_instructions(varFont, ship=True)
     else:
         file_path = (OUTPUT_TTF_DIR / str(file_stem+"_VTT")).with_suffix(".ttf")
 
@@ -274,76 +1283,1194 @@ def compile_variable_and_save(
     if "Regular" in styleName:
         varFont["name"].setName(familyName.replace(" ","")+"Roman", 25, 3, 1, 1033)
 
+    with measure("buildStatTable"):
+        add_stat_table(varFont, f"{file_stem}.ttf")
+
     print(f"[{familyName} {styleName}] Saving")
     file_path.parent.mkdir(exist_ok=True, parents=True)
     varFont.save(file_path)
 
     print(f"[{familyName}] Done: {file_path}")
+    return file_path
+
+
+def compile_vtt_glyph_programs(
+    glyph_order: List[str], glyph_programs: Dict[str, str]
+) -> Dict[str, Tuple[Any, List[Any]]]:
+    """Compile the VTT assembly of some glyphs of a font.
+
+    This is the slow part of vttLib.compile_instructions, split off so that
+    the glyphs of one font can be compiled by several jobs at once. Only the
+    glyphs' TSI1 programs are needed, not the font.
+    """
+    font = fontTools.ttLib.TTFont()
+    font.setGlyphOrder(glyph_order)
+    font["TSI1"] = fontTools.ttLib.newTable("TSI1")
+    font["TSI1"].glyphPrograms = glyph_programs
+    font["TSI1"].extraPrograms = {}
+    programs = {}
+    with measure("vttLib.make_glyph_program"):
+        for glyph_name in glyph_order:
+            try:
+                data = vttLib.get_glyph_assembly(font, glyph_name)
+            except KeyError:
+                continue
+            programs[glyph_name] = vttLib.make_glyph_program(data, glyph_name)
+    return programs
+
+
+@instrumented
+def compile_vtt_and_save(
+    source_path: Path,
+    glyph_order: List[str],
+    programs: Dict[str, Tuple[Any, List[Any]]],
+    cache_dir: Optional[Path],
+    key: str,
+) -> Path:
+    """Finish a font saved with its VTT sources, given its compiled glyph programs.
+
+    The result is the same as compile_variable_and_save with vtt_compile.
+    """
+    file_path = source_path.with_name(source_path.stem[: -len("_VTT")] + source_path.suffix)
+    print(f"[{file_path.stem}] Compiling VTT")
+    varFont = fontTools.ttLib.TTFont(source_path)
+    if varFont.getGlyphOrder() != glyph_order:
+        raise RuntimeError("The glyph programs were compiled for another glyph order")
+    # Without glyph assembly, compile_instructions only does the cvt, cvar,
+    # fpgm and prep. The glyphs are set below, the way it would have.
+    varFont["TSI1"].glyphPrograms = {}
+    with measure("vttLib.compile_instructions"):
+        vttLib.compile_instructions(varFont, ship=True)
+        glyph_order = varFont.getGlyphOrder()
+        glyf_table = varFont["glyf"]
+        for glyph_name in glyph_order:
+            if glyph_name not in programs:
+                continue
+            program, components = programs[glyph_name]
+            if not (program or components):
+                continue
+            glyph = glyf_table[glyph_name]
+            if components:
+                if not glyph.isComposite():
+                    # The assembly would be dropped, but the TSI tables are
+                    # not shipped anyway.
+                    vttLib.log.warning(
+                        "Glyph '%s' contains components in VTT assembly but "
+                        "not in glyf table; drop assembly and skip "
+                        "compilation" % glyph_name
+                    )
+                else:
+                    vttLib.check_composite_info(glyph_name, glyph, components, glyph_order)
+                    vttLib.set_components_flags(glyph, components)
+            if program:
+                glyph.program = program
+
+    print(f"[{file_path.stem}] Saving")
+    varFont.save(file_path)
+    source_path.unlink()
+    cache_store(cache_dir, key, [file_path])
 
+    print(f"[{file_path.stem}] Done: {file_path}")
+    return file_path
 
-def compile_static_and_save(instance: ufoLib2.Font, name:str) -> None:
+
+def static_file_name(family_name: str, style_name: str) -> str:
+    return f"{family_name}-{style_name}".replace(" ", "")
+
+
+@instrumented
+def compile_static_and_save(
+    instance: ufoLib2.Font, name: str, formats: Sequence[str] = ("ttf", "otf")
+) -> List[Path]:
     family_name = name
     style_name = instance.info.styleName
     print(f"[{family_name}] Building static instance: {style_name}")
 
+    file_name = static_file_name(family_name, style_name)
+    file_paths = []
     # Use pathops backend for overlap removal because it is, at the time of this
     # writing, massively faster than booleanOperations and thanks to autohinting,
     # there is no need to keep outlines compatible to previous releases.
-    static_ttf = ufo2ft.compileTTF(
-        instance, removeOverlaps=True, overlapsBackend="pathops"
+    with measure("remove_overlaps"):
+        decomposed = remove_overlaps(instance)
+    # The UFO's filters ran above, don't run them again on their own output.
+    # The TTF and OTF have the same glyphs and features, so the OTF reuses
+    # the TTF's GSUB, GPOS and GDEF.
+    feature_compiler_class = shared_layout_compiler()
+    if "ttf" in formats:
+        with measure("ufo2ft.compileTTF"):
+            static_ttf = ufo2ft.compileTTF(
+                instance,
+                filters=[],
+                featureCompilerClass=feature_compiler_class,
+            )
+        file_path_static = (OUTPUT_STATIC_TTF_DIR / file_name).with_suffix(".ttf")
+        file_path_static.parent.mkdir(exist_ok=True, parents=True)
+        static_ttf.save(file_path_static)
+        file_paths.append(file_path_static)
+    if "otf" in formats:
+        for glyph_name, contours in decomposed.items():
+            instance[glyph_name].clearComponents()
+            instance[glyph_name].contours.extend(contours)
+        with measure("ufo2ft.compileOTF"):
+            static_otf = ufo2ft.compileOTF(
+                instance,
+                filters=[],
+                # Can do inplace now because TTF is already done, or not needed.
+                inplace=True,
+                # Don't optimize here, will be optimized after autohinting.
+                optimizeCFF=ufo2ft.CFFOptimization.NONE,
+                featureCompilerClass=feature_compiler_class,
+            )
+        file_path_static_otf = (OUTPUT_STATIC_OTF_DIR / file_name).with_suffix(".otf")
+        file_path_static_otf.parent.mkdir(exist_ok=True, parents=True)
+        static_otf.save(file_path_static_otf)
+        file_paths.append(file_path_static_otf)
+    print(f"[{family_name}] Done: {', '.join(map(str, file_paths))}")
+    return file_paths
+
+
+# Mono from Code
+# ****************************************************************
+# A Mono font is its Code counterpart without the coding ligatures: the same
+# outlines, hinting and positioning, with its own calt feature and names. So
+# rather than compiling it from the UFOs again, it is derived from the Code
+# font as soon as that is compiled.
+
+
+def mono_name(name: str) -> str:
+    return name.replace("Cascadia Code", "Cascadia Mono")
+
+
+def family_names(name: str, mono: bool) -> List[str]:
+    """The family a build job compiles, and the Mono family it derives with mono."""
+    return [name, mono_name(name)] if mono else [name]
+
+
+def source_glyph_names(ufo: ufoLib2.Font) -> Dict[str, str]:
+    """Map the glyph names of a font compiled from a UFO to the UFO's, in order."""
+    skip_export_glyphs = set(ufo.lib.get("public.skipExportGlyphs", []))
+    glyph_order = makeOfficialGlyphOrder(
+        {name: None for name in ufo.keys() if name not in skip_export_glyphs},
+        ufo.glyphOrder,
     )
-    static_otf = ufo2ft.compileOTF(
-        instance,
-        removeOverlaps=True,
-        overlapsBackend="pathops",
-        # Can do inplace now because TTF is already done.
-        inplace=True,
-        # Don't optimize here, will be optimized after autohinting.
-        optimizeCFF=ufo2ft.CFFOptimization.NONE,
+    # Rename them to production names the way ufo2ft does.
+    source = fontTools.ttLib.TTFont()
+    source.setGlyphOrder(glyph_order)
+    rename_map = {}
+    if ufo.lib.get("public.postscriptNames"):
+        rename_map = PostProcessor(source, ufo)._build_production_names()
+    return {rename_map.get(name, name): name for name in glyph_order}
+
+
+def conditional_substitutions(
+    designspace: fontTools.designspaceLib.DesignSpaceDocument,
+) -> List[Tuple[List[Dict[str, Tuple[float, float]]], Dict[str, str]]]:
+    """The designspace rules as addFeatureVariations takes them, the way
+    varLib.build converts them."""
+    axis_tags = {axis.name: axis.tag for axis in designspace.axes}
+    substitutions = []
+    for rule in designspace.rules:
+        region = []
+        for conditions in rule.conditionSets:
+            box = {}
+            for condition in conditions:
+                name = condition["name"]
+                minimum, maximum = -1.0, 1.0
+                if condition.get("minimum") is not None:
+                    minimum = designspace.normalizeLocation({name: condition["minimum"]})[name]
+                if condition.get("maximum") is not None:
+                    maximum = designspace.normalizeLocation({name: condition["maximum"]})[name]
+                box[axis_tags[name]] = (minimum, maximum)
+            region.append(box)
+        substitutions.append((region, dict(rule.subs)))
+    return substitutions
+
+
+def feature_variations_tags(
+    designspace: fontTools.designspaceLib.DesignSpaceDocument,
+) -> List[str]:
+    tags = designspace.lib.get(
+        FEAVAR_FEATURETAG_LIB_KEY, "rclt" if designspace.rulesProcessingLast else "rvrn"
     )
+    return sorted({tag.strip() for tag in tags.split(",")})
 
-    file_name = f"{family_name}-{style_name}".replace(" ", "")
-    file_path_static = (OUTPUT_STATIC_TTF_DIR / file_name).with_suffix(".ttf")
-    file_path_static_otf = (OUTPUT_STATIC_OTF_DIR / file_name).with_suffix(".otf")
 
-    file_path_static.parent.mkdir(exist_ok=True, parents=True)
-    static_ttf.save(file_path_static)
-    file_path_static_otf.parent.mkdir(exist_ok=True, parents=True)
-    static_otf.save(file_path_static_otf)
-    print(f"[{family_name}] Done: {file_path_static}, {file_path_static_otf}")
+def derive_mono_font(
+    font: fontTools.ttLib.TTFont,
+    glyph_names: Dict[str, str],
+    name: str,
+    designspace: Optional[fontTools.designspaceLib.DesignSpaceDocument] = None,
+) -> None:
+    """Turn a compiled Code font into its Mono counterpart in place.
+
+    The glyph names are source_glyph_names() of the UFO the font was compiled
+    from. Pass the designspace of a variable font to add its rules to the new
+    GSUB.
+    """
+    if list(glyph_names) != font.getGlyphOrder():
+        raise RuntimeError("The font's glyph order does not match the UFO it was compiled from")
+    # Compile the Mono GSUB against the source glyph names, then read it
+    # back into the font, where the glyphs have the same IDs.
+    source = fontTools.ttLib.TTFont()
+    source.setGlyphOrder(list(glyph_names.values()))
+    features = "".join(path.read_text() for path in feature_files(FEATURES_DIR, mono_name(name)))
+    with measure("feaLib.build"):
+        addOpenTypeFeaturesFromString(source, features, tables=["GSUB"])
+    if designspace is not None and designspace.rules:
+        source["fvar"] = font["fvar"]
+        addFeatureVariations(
+            source,
+            conditional_substitutions(designspace),
+            feature_variations_tags(designspace),
+        )
+    gsub = fontTools.ttLib.newTable("GSUB")
+    gsub.decompile(source["GSUB"].compile(source), font)
+    font["GSUB"] = gsub
+    font["OS/2"].usMaxContext = maxCtxFont(font)
+
+    # The family name shows up in the names built from it, with and without
+    # spaces, and in the CFF names. The trademark notice stays as it is.
+    code_family = name.replace(" Italic", "")
+    renames = [
+        (code_family, mono_name(code_family)),
+        (code_family.replace(" ", ""), mono_name(code_family).replace(" ", "")),
+    ]
+
+    def rename(string: str) -> str:
+        for old, new in renames:
+            string = string.replace(old, new)
+        return string
+
+    for record in font["name"].names:
+        if record.nameID in (1, 3, 4, 6, 16, 18, 21, 25):
+            record.string = rename(record.toUnicode())
+    if "CFF " in font:
+        cff = font["CFF "].cff
+        cff.fontNames = [rename(font_name) for font_name in cff.fontNames]
+        top_dict = cff.topDictIndex[0]
+        top_dict.FullName = rename(top_dict.FullName)
+        top_dict.FamilyName = rename(top_dict.FamilyName)
+
+
+@instrumented
+def derive_mono_and_save(
+    file_path: Path,
+    glyph_names: Dict[str, str],
+    name: str,
+    designspace: Optional[fontTools.designspaceLib.DesignSpaceDocument] = None,
+) -> Path:
+    mono_path = file_path.with_name(file_path.name.replace("CascadiaCode", "CascadiaMono", 1))
+    print(f"[{mono_name(name)}] Deriving from {file_path.name}")
+    font = fontTools.ttLib.TTFont(file_path)
+    derive_mono_font(font, glyph_names, name, designspace)
+    font.save(mono_path)
+    print(f"[{mono_name(name)}] Done: {mono_path}")
+    return mono_path
+
+
+# Static fonts from variable fonts
+# ****************************************************************
+
+# Tables that only hold hinting or its VTT sources. The UFO-compiled statics
+# get theirs from ttfautohint, so they differ from the VTT hinting of the
+# variable fonts by construction.
+HINTING_TABLES = ["cvt ", "fpgm", "prep", "hdmx", "LTSH", "VDMX", "TTFA"] + VTT_TABLES[:-1]
+# Glyphs whose filled area differs by more than this fraction, or whose
+# bounding box moved by more than one unit, count as different outlines.
+STATIC_DIFF_AREA_TOLERANCE = 0.005
+
+
+def remove_hinting(font: fontTools.ttLib.TTFont) -> None:
+    for tag in HINTING_TABLES:
+        if tag in font:
+            del font[tag]
+    glyf = cast(_g_l_y_f.table__g_l_y_f, font["glyf"])
+    for glyph_name in glyf.keys():
+        glyf[glyph_name].removeHinting()
+    maxp = font["maxp"]
+    maxp.maxZones = 1
+    maxp.maxTwilightPoints = 0
+    maxp.maxStorage = 0
+    maxp.maxFunctionDefs = 0
+    maxp.maxInstructionDefs = 0
+    maxp.maxStackElements = 0
+    maxp.maxSizeOfInstructions = 0
+
+
+def apply_rule_swaps(font: fontTools.ttLib.TTFont) -> None:
+    """Swap the glyphs that the designspace rules substitute at the font's location.
+
+    The instancer leaves the rules as an rvrn feature, where the UFO instances
+    have the glyphs swapped by fontmake's instantiator. Do as it does: swap
+    outlines, advances, component references and positioning, but not the
+    characters the glyphs are mapped to or the names in the other features.
+    """
+    gsub = font["GSUB"].table
+    records = gsub.FeatureList.FeatureRecord
+    swaps: Dict[str, str] = {}
+    for record in records:
+        if record.FeatureTag == "rvrn":
+            for index in record.Feature.LookupListIndex:
+                for subtable in gsub.LookupList.Lookup[index].SubTable:
+                    swaps.update(subtable.mapping)
+    if not swaps:
+        return
+    font["GSUB"].subset_feature_tags({r.FeatureTag for r in records} - {"rvrn"})
+    font["GSUB"].prune_lookups()
+
+    swaps.update({new: old for old, new in swaps.items()})
+    glyf = cast(_g_l_y_f.table__g_l_y_f, font["glyf"])
+    hmtx = font["hmtx"]
+    glyphs = {name: glyf[name] for name in swaps}
+    metrics = {name: hmtx[name] for name in swaps}
+    for name, swapped in swaps.items():
+        glyf[name] = glyphs[swapped]
+        hmtx[name] = metrics[swapped]
+    for glyph_name in glyf.keys():
+        glyph = glyf[glyph_name]
+        if glyph.isComposite():
+            for component in glyph.components:
+                component.glyphName = swaps.get(component.glyphName, component.glyphName)
+
+    # Read the positioning back in with the names swapped, then sort its
+    # coverages and the records that go with them back into glyph order.
+    glyph_order = font.getGlyphOrder()
+    renamed = fontTools.ttLib.TTFont()
+    renamed.setGlyphOrder([swaps.get(name, name) for name in glyph_order])
+    gpos = fontTools.ttLib.newTable("GPOS")
+    gpos.decompile(font["GPOS"].compile(font), renamed)
+    renamed["GPOS"] = gpos
+    reorderGlyphs(renamed, glyph_order)
+    font["GPOS"] = renamed["GPOS"]
+
+
+def set_static_font_info(
+    font: fontTools.ttLib.TTFont,
+    family_name: str,
+    instance_descriptor: fontTools.designspaceLib.InstanceDescriptor,
+) -> None:
+    """Give a font cut out of a variable font the names and style bits of
+    the same instance compiled from UFO."""
+    # The font info ufo2ft builds an instance's names from, the rest comes
+    # from the masters and is the same in the variable font.
+    info = ufoLib2.Font().info
+    info.familyName = family_name
+    info.styleName = instance_descriptor.styleName
+    if instance_descriptor.styleMapFamilyName:
+        info.styleMapFamilyName = instance_descriptor.styleMapFamilyName.replace(
+            "Cascadia Code", family_name
+        )
+    info.styleMapStyleName = instance_descriptor.styleMapStyleName
+    info.versionMajor = VERSION_YEAR_MONTH
+    info.versionMinor = VERSION_DAY
+    info.openTypeOS2VendorID = font["OS/2"].achVendID
+
+    # Same as ufo2ft's OutlineCompiler.setupTable_name.
+    style_map_style_name = getAttrWithFallback(info, "styleMapStyleName")
+    preferred_family_name = getAttrWithFallback(info, "openTypeNamePreferredFamilyName")
+    preferred_subfamily_name = getAttrWithFallback(info, "openTypeNamePreferredSubfamilyName")
+    names = {
+        1: getAttrWithFallback(info, "styleMapFamilyName"),
+        2: style_map_style_name.title(),
+        3: getAttrWithFallback(info, "openTypeNameUniqueID"),
+        4: f"{preferred_family_name} {preferred_subfamily_name}",
+        6: normalizeStringForPostscript(getAttrWithFallback(info, "postscriptFontName")),
+        16: preferred_family_name,
+        17: preferred_subfamily_name,
+    }
+    if names[1] == names[16] and names[2] == names[17]:
+        del names[16]
+        del names[17]
+
+    # Everything from 256 up names STAT and fvar entries, and 25 is the
+    # variations PostScript name prefix, neither of which a static font has.
+    name_table = font["name"]
+    name_table.names = [
+        record
+        for record in name_table.names
+        if record.nameID not in (1, 2, 3, 4, 6, 16, 17, 25) and record.nameID < 256
+    ]
+    for name_id, value in names.items():
+        name_table.setName(value, name_id, 3, 1, 0x409)
+    if "STAT" in font:
+        del font["STAT"]
+
+    bold = "bold" in style_map_style_name
+    italic = "italic" in style_map_style_name
+    os2 = font["OS/2"]
+    os2.fsSelection &= ~(1 << 0 | 1 << 5 | 1 << 6)
+    os2.fsSelection |= italic << 0 | bold << 5 | (not bold and not italic) << 6
+    # The UFO instances carry no PANOSE, only the masters do.
+    os2.panose = O_S_2f_2.Panose()
+    font["head"].macStyle = bold << 0 | italic << 1
+    # What ufo2ft sets, the variable fonts have VTT-specific flags on top.
+    font["head"].flags = 0x0003
+
+
+def instance_cache_key(
+    data: bytes,
+    instance_descriptor: fontTools.designspaceLib.InstanceDescriptor,
+    target_path: Path,
+) -> str:
+    inputs = {
+        "build.py": hash_path(Path(__file__)),
+        "tools": {tool: metadata.version(tool) for tool in CACHE_TOOLS},
+        "ttf": hashlib.sha256(data).hexdigest(),
+        "instance": instance_descriptor.name,
+        "target": target_path.as_posix(),
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+@instrumented
+def instance_static_and_save(
+    variable_path: Path,
+    designspace: fontTools.designspaceLib.DesignSpaceDocument,
+    instance_descriptor: fontTools.designspaceLib.InstanceDescriptor,
+    name: str,
+    target_dir: Path,
+    cache_dir: Optional[Path] = None,
+) -> Path:
+    """Cut a static instance out of a compiled variable font.
+
+    This stands in for build_font_static's TTF: the outlines are interpolated
+    and freed of overlaps from the variable font's, then the names and style
+    bits set as for the UFO-compiled instance. The hinting is removed, as
+    overlap removal breaks it for the glyphs it changes anyway.
+    """
+    family_name = name.replace(" Italic", "")
+    style_name = instance_descriptor.styleName
+    file_path = (target_dir / static_file_name(family_name, style_name)).with_suffix(".ttf")
+    data = variable_path.read_bytes()
+    key = instance_cache_key(data, instance_descriptor, file_path)
+    cached = cache_restore(cache_dir, key)
+    if cached:
+        return cached[0]
+
+    print(f"[{family_name}] Instancing {variable_path.name}: {style_name}")
+    location = {
+        designspace.getAxis(axis_name).tag: value
+        for axis_name, value in instance_descriptor.getFullUserLocation(designspace).items()
+    }
+    varFont = fontTools.ttLib.TTFont(io.BytesIO(data))
+    with measure("instancer.instantiateVariableFont"):
+        static_ttf = instancer.instantiateVariableFont(
+            varFont, location, inplace=True, overlap=instancer.OverlapMode.REMOVE
+        )
+    apply_rule_swaps(static_ttf)
+    remove_hinting(static_ttf)
+    set_static_font_info(static_ttf, family_name, instance_descriptor)
+
+    file_path.parent.mkdir(exist_ok=True, parents=True)
+    static_ttf.save(file_path)
+    cache_store(cache_dir, key, [file_path])
+    print(f"[{family_name}] Done: {file_path}")
+    return file_path
+
+
+def glyph_metrics(
+    font: fontTools.ttLib.TTFont,
+) -> Dict[str, Tuple[int, Optional[Tuple[int, int, int, int]], float]]:
+    """Advance, bounding box and filled area of every glyph, with overlaps
+    removed so that composites and their decomposed outlines measure the same."""
+    glyph_set = font.getGlyphSet()
+    glyf = cast(_g_l_y_f.table__g_l_y_f, font["glyf"])
+    metrics = {}
+    for glyph_name in font.getGlyphOrder():
+        glyph = glyf[glyph_name]
+        bounds = None
+        if glyph.numberOfContours:
+            bounds = (glyph.xMin, glyph.yMin, glyph.xMax, glyph.yMax)
+        path = pathops.Path()
+        glyph_set[glyph_name].draw(path.getPen(glyphSet=glyph_set))
+        path.simplify()
+        metrics[glyph_name] = (font["hmtx"][glyph_name][0], bounds, abs(path.area))
+    return metrics
+
+
+@instrumented
+def static_diff(reference_path: Path, derived_path: Path) -> Dict[str, Any]:
+    """Compare a static font cut out of a variable font with the one compiled from UFO.
+
+    Tables are compared as compiled, except for the hinting tables. Glyphs
+    are compared by advance, bounding box and filled area, which don't depend
+    on the order or start points of the contours, or on whether overlapping
+    components were decomposed.
+    """
+    print(f"Comparing {derived_path} to {reference_path}")
+    reference = fontTools.ttLib.TTFont(reference_path)
+    derived = fontTools.ttLib.TTFont(derived_path)
+    for font in (reference, derived):
+        font["head"].modified = 0
+        font["head"].checkSumAdjustment = 0
+
+    tables = {}
+    for tag in sorted((set(reference.keys()) | set(derived.keys())) - {"GlyphOrder"}):
+        if tag in HINTING_TABLES:
+            continue
+        if tag not in derived:
+            tables[tag] = "reference only"
+        elif tag not in reference:
+            tables[tag] = "derived only"
+        elif reference[tag].compile(reference) == derived[tag].compile(derived):
+            tables[tag] = "same"
+        else:
+            tables[tag] = "differs"
+
+    reference_cmap = reference.getBestCmap()
+    derived_cmap = derived.getBestCmap()
+    glyphs: Dict[str, List[str]] = {
+        "reference only": sorted(set(reference.getGlyphOrder()) - set(derived.getGlyphOrder())),
+        "derived only": sorted(set(derived.getGlyphOrder()) - set(reference.getGlyphOrder())),
+        "cmap": [
+            f"U+{codepoint:04X}"
+            for codepoint in sorted(set(reference_cmap) | set(derived_cmap))
+            if reference_cmap.get(codepoint) != derived_cmap.get(codepoint)
+        ],
+        "advance": [],
+        "bounds": [],
+        "area": [],
+    }
+    with measure("glyph_metrics"):
+        reference_metrics = glyph_metrics(reference)
+        derived_metrics = glyph_metrics(derived)
+    for glyph_name, (advance, bounds, area) in reference_metrics.items():
+        if glyph_name not in derived_metrics:
+            continue
+        derived_advance, derived_bounds, derived_area = derived_metrics[glyph_name]
+        if advance != derived_advance:
+            glyphs["advance"].append(glyph_name)
+        if (bounds is None) != (derived_bounds is None) or (
+            bounds is not None
+            and max(abs(a - b) for a, b in zip(bounds, derived_bounds)) > 1
+        ):
+            glyphs["bounds"].append(glyph_name)
+        if abs(area - derived_area) > STATIC_DIFF_AREA_TOLERANCE * max(area, 1):
+            glyphs["area"].append(glyph_name)
+
+    return {
+        "reference": os.fspath(reference_path),
+        "derived": os.fspath(derived_path),
+        "glyph_count": len(reference_metrics),
+        "tables": tables,
+        "glyphs": glyphs,
+    }
+
+
+def write_static_diff_report(diffs: List[Dict[str, Any]], path: Path) -> None:
+    path.parent.mkdir(exist_ok=True, parents=True)
+    path.write_text(json.dumps(diffs, indent=2))
+    print(f"{'Font':<40} {'Tables':>7} {'Advance':>8} {'Bounds':>7} {'Area':>6}")
+    for diff in sorted(diffs, key=lambda d: d["derived"]):
+        differing = [t for t, state in diff["tables"].items() if state != "same"]
+        print(
+            f"{Path(diff['derived']).name:<40} {len(differing):>7} "
+            f"{len(diff['glyphs']['advance']):>8} {len(diff['glyphs']['bounds']):>7} "
+            f"{len(diff['glyphs']['area']):>6}"
+        )
+    print(f"Static font diff report written to {path}")
 
 
 # Font hinting
 # ****************************************************************
 
 
-def autohint(otf_path: Path) -> None:
+# Glyphs as psautohint hinted them, by the hash of their global hint
+# parameters and unhinted outline, for the hint parameters in HINT_CACHE_KEY.
+# The Code, Mono, PL and NF variants of a weight share nearly all of these, and
+# glyphs that do not change with weight are shared across weights too. Each
+# job starts from the copy in the build cache and adds its glyphs to it, so
+# that later jobs and builds reuse them.
+HINT_CACHE: Dict[str, str] = {}
+HINT_CACHE_KEY: Optional[str] = None
+
+
+def hint_cache_key(options: psautohint.autohint.ACOptions, hint_parameters: Set[str]) -> str:
+    inputs = {
+        "psautohint": metadata.version("psautohint"),
+        "hint_parameters": sorted(hint_parameters),
+        "options": [
+            options.allowChanges,
+            options.noHintSub,
+            options.round_coords,
+            options.read_hints,
+            options.hintAll,
+            options.noFlex,
+            options.allow_no_blues,
+        ],
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def hint_cache_path(cache_dir: Path, key: str) -> Path:
+    return cache_dir / "psautohint" / f"{key}.json"
+
+
+def load_hint_cache(cache_dir: Optional[Path], key: str) -> None:
+    global HINT_CACHE_KEY
+    if key == HINT_CACHE_KEY:
+        return
+    HINT_CACHE.clear()
+    HINT_CACHE_KEY = key
+    if cache_dir is not None and hint_cache_path(cache_dir, key).exists():
+        HINT_CACHE.update(json.loads(hint_cache_path(cache_dir, key).read_text()))
+
+
+def store_hint_cache(cache_dir: Optional[Path], key: str) -> None:
+    if cache_dir is None:
+        return
+    path = hint_cache_path(cache_dir, key)
+    path.parent.mkdir(exist_ok=True, parents=True)
+    # Keep what concurrent jobs stored meanwhile, and replace the file in one
+    # step so that they never read it half-written.
+    if path.exists():
+        HINT_CACHE.update(json.loads(path.read_text()))
+    fd, scratch = tempfile.mkstemp(dir=path.parent, suffix=".json")
+    with os.fdopen(fd, "w") as file:
+        json.dump(HINT_CACHE, file)
+    os.replace(scratch, path)
+
+
+def psautohint_cached(path: str, cache_dir: Optional[Path]) -> None:
+    """Hint an OTF like psautohint's command line, reusing cached glyphs."""
+    # Same as psautohint.autohint.hint_regular_fonts, with a cache in front of
+    # hint_glyph. Glyphs are hinted one at a time from their own outline and
+    # the global hint parameters, so reusing them gives the same font.
+    options, _ = psautohint.__main__.get_options([path])
+    font = psautohint.autohint.openFile(path, options)
+    glyph_names = psautohint.autohint.get_glyph_list(options, font, path)
+    fontinfo_list = psautohint.autohint.get_fontinfo_list(options, font, glyph_names)
+    # The hint parameters start with the font's name, which psautohint only
+    # reports and which is all that differs between the variants of a weight.
+    hint_parameters = {
+        name: re.sub(r"^FontName .*\n", "", fontinfo)
+        for name, (fontinfo, _, _) in fontinfo_list.items()
+    }
+    key = hint_cache_key(options, set(hint_parameters.values()))
+    load_hint_cache(cache_dir, key)
+
+    misses = 0
+    hinted = False
+    glyphs = psautohint.autohint.get_bez_glyphs(options, font, glyph_names)
+    for name, (bez_glyph, _) in glyphs.items():
+        glyph_key = hashlib.sha256(f"{hint_parameters[name]}\0{bez_glyph}".encode()).hexdigest()
+        new_bez_glyph = HINT_CACHE.get(glyph_key)
+        if new_bez_glyph is None:
+            fontinfo = fontinfo_list[name][0]
+            new_bez_glyph = psautohint.autohint.hint_glyph(options, name, bez_glyph, fontinfo)
+            HINT_CACHE[glyph_key] = new_bez_glyph
+            misses += 1
+        # Only glyphs that got any stem hints, as psautohint.autohint.hint_font.
+        if any(op in new_bez_glyph for op in ("ry", "rb", "rm", "rv")):
+            font.updateFromBez(new_bez_glyph, name)
+            hinted = True
+    print(f"[{Path(path).name}] Reused {len(glyphs) - misses} of {len(glyphs)} hinted glyphs")
+    if hinted:
+        font.save(path)
+    else:
+        font.close()
+    if misses:
+        store_hint_cache(cache_dir, key)
+
+
+@instrumented
+def autohint(otf_path: Path, cache_dir: Optional[Path] = None) -> None:
     path = os.fspath(otf_path)
+    # A font restored from the build cache is hinted and subroutinized the
+    # same way again, so reuse the result of the last time.
+    key = postprocess_cache_key(
+        otf_path.read_bytes(),
+        otf_path,
+        "autohint",
+        {tool: metadata.version(tool) for tool in ("psautohint", "cffsubr")},
+    )
+    if cache_restore(cache_dir, key):
+        return
 
     print(f"Autohinting {path}")
-    psautohint.__main__.main([path])
+    hinted = True
+    with measure("psautohint"):
+        try:
+            psautohint_cached(path, cache_dir)
+        except Exception as e:
+            # psautohint's command line logs the error and leaves the font as is.
+            print(f"[{otf_path.name}] psautohint failed, leaving it unhinted: {e}")
+            hinted = False
 
     print(f"Compressing {path}")
-    cffsubr.__main__.main(["-i", path])
-
+    with measure("cffsubr"):
+        cffsubr.__main__.main(["-i", path])
+    # Try again next time rather than reusing an unhinted font.
+    if hinted:
+        cache_store(cache_dir, key, [otf_path])
+
+
+def try_ttfautohint(path: str, cache_dir: Optional[Path] = None) -> Optional[str]:
+    """Run ttfautohint, returning the reason it failed rather than raising."""
+    try:
+        ttfautohint(path, cache_dir)
+    except Exception as e:
+        return str(e)
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def ttfautohint_version() -> str:
+    result = subprocess.run(
+        ["ttfautohint", "--version"], stdout=subprocess.PIPE, universal_newlines=True
+    )
+    return result.stdout.strip().splitlines()[0] if result.stdout.strip() else ""
+
+
+@instrumented
+def ttfautohint(path: str, cache_dir: Optional[Path] = None) -> None:
+    reference_path = OUTPUT_STATIC_TTF_DIR / "CascadiaCode-Regular.ttf"
+    key = postprocess_cache_key(
+        Path(path).read_bytes(),
+        Path(path),
+        "ttfautohint",
+        {
+            "ttfautohint": ttfautohint_version(),
+            "reference": hashlib.sha256(reference_path.read_bytes()).hexdigest(),
+        },
+    )
+    if cache_restore(cache_dir, key):
+        return
 
-def ttfautohint(path: str) -> None:
     print(f"Autohinting {path}")
-    subprocess.check_call(
-        [
-            "ttfautohint",
-            "--stem-width",
-            "nsn",
-            "--increase-x-height",
-            "0",
-            "--reference",
-            os.fspath(OUTPUT_STATIC_TTF_DIR / "CascadiaCode-Regular.ttf"),
-            path,
-            path[:-4] + "-hinted.ttf",
-        ]
+    # Hint into a temporary file and move it over the font in one step, so
+    # that a failed or interrupted run never leaves it half-written.
+    fd, hinted_path = tempfile.mkstemp(
+        prefix=Path(path).stem + "-", suffix="-hinted.ttf", dir=os.path.dirname(path)
     )
-    os.remove(path)
-    os.rename(path[:-4] + "-hinted.ttf", path)
+    os.close(fd)
+    try:
+        result = subprocess.run(
+            [
+                "ttfautohint",
+                "--stem-width",
+                "nsn",
+                "--increase-x-height",
+                "0",
+                "--reference",
+                os.fspath(reference_path),
+                path,
+                hinted_path,
+            ],
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(
+                f"ttfautohint exited with status {result.returncode}: {result.stderr.strip()}"
+            )
+        os.replace(hinted_path, path)
+    finally:
+        if os.path.exists(hinted_path):
+            os.remove(hinted_path)
+    cache_store(cache_dir, key, [Path(path)])
+
+
+# Web font subsets
+# ****************************************************************
+
+# Slices of the web fonts, so that browsers only download the ones a page
+# uses. Every codepoint goes to the first slice that covers it. After these
+# come a slice for each Nerd Fonts icon set and "symbols" for everything left.
+WEB_FONT_SLICES: Dict[str, List[Tuple[int, int]]] = {
+    "latin": [
+        (0x0000, 0x036F),
+        (0x1D00, 0x1DFF),
+        (0x1E00, 0x1EFF),
+        (0x2000, 0x20CF),
+        (0x2100, 0x214F),
+        (0x2C60, 0x2C7F),
+        (0xA720, 0xA7FF),
+        (0xFB00, 0xFB06),
+    ],
+    "greek": [(0x0370, 0x03FF), (0x1F00, 0x1FFF)],
+    "cyrillic": [(0x0400, 0x052F), (0x1C80, 0x1C8F), (0x2DE0, 0x2DFF), (0xA640, 0xA69F)],
+    "hebrew": [(0x0590, 0x05FF), (0xFB1D, 0xFB4F)],
+    "arabic": [(0x0600, 0x06FF), (0x0750, 0x077F), (0x0870, 0x08FF), (0xFB50, 0xFDFF), (0xFE70, 0xFEFE)],
+    "powerline": [(0xE0A0, 0xE0A3), (0xE0B0, 0xE0D7)],
+}
+# Kept in every slice, but left out of its unicode-range, so that shaping and
+# contextual alternates within a slice still see spaces and joiners.
+WEB_FONT_SHARED = [0x0020, 0x00A0, 0x200C, 0x200D, 0x25CC]
+
+
+def is_private_use(codepoint: int) -> bool:
+    return 0xE000 <= codepoint <= 0xF8FF or codepoint >= 0xF0000
+
+
+def web_font_slices() -> Dict[str, List[Tuple[int, int]]]:
+    slices = dict(WEB_FONT_SLICES)
+    for name, font in open_glyph_pack(GLYPH_PACK_FILE).items():
+        # Icons outside the Private Use Areas, like octicons' heart, are
+        # regular characters that Cascadia may draw itself.
+        codepoints = sorted(
+            {u for glyph in font.glyphs for u in glyph.get("unicodes", []) if is_private_use(u)}
+        )
+        slices["nf-" + re.sub(r"[^a-z0-9]+", "-", Path(name).stem.lower())] = unicode_ranges(codepoints)
+    slices["symbols"] = [(0x0000, 0x10FFFF)]
+    return slices
+
+
+def unicode_ranges(codepoints: Sequence[int]) -> List[Tuple[int, int]]:
+    """Collapse sorted codepoints into inclusive ranges."""
+    ranges: List[Tuple[int, int]] = []
+    for codepoint in codepoints:
+        if ranges and ranges[-1][1] == codepoint - 1:
+            ranges[-1] = (ranges[-1][0], codepoint)
+        else:
+            ranges.append((codepoint, codepoint))
+    return ranges
+
+
+def css_unicode_range(ranges: Sequence[Tuple[int, int]]) -> str:
+    return ", ".join(
+        f"U+{start:04X}" if start == end else f"U+{start:04X}-{end:04X}"
+        for start, end in ranges
+    )
+
+
+def web_font_subsets_cache_key(
+    data: bytes, target_dir: Path, slices: Dict[str, List[Tuple[int, int]]], quality: int
+) -> str:
+    inputs = {
+        "build.py": hash_path(Path(__file__)),
+        "ttf": hashlib.sha256(data).hexdigest(),
+        "target": target_dir.as_posix(),
+        "slices": slices,
+        "quality": quality,
+        "fonttools": metadata.version("fonttools"),
+        "brotli": getattr(fontTools.ttLib.woff2.brotli, "__version__", None),
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+@instrumented
+def subset_web_font(
+    source_path: Path,
+    target_dir: Path,
+    quality: int = WOFF2_QUALITY,
+    cache_dir: Optional[Path] = None,
+) -> List[Path]:
+    """Split a font into WOFF2 slices and write a CSS file loading them by unicode-range."""
+    data = source_path.read_bytes()
+    slices = web_font_slices()
+    key = web_font_subsets_cache_key(data, target_dir, slices, quality)
+    cached = cache_restore(cache_dir, key)
+    if cached:
+        return cached
+
+    font = fontTools.ttLib.TTFont(io.BytesIO(data))
+    cmap = set(font.getBestCmap())
+    shared = [u for u in WEB_FONT_SHARED if u in cmap]
+    if "fvar" in font and any(a.axisTag == "wght" for a in font["fvar"].axes):
+        axis = next(a for a in font["fvar"].axes if a.axisTag == "wght")
+        weight = f"{axis.minValue:g} {axis.maxValue:g}"
+    else:
+        weight = str(font["OS/2"].usWeightClass)
+    face = [
+        f'  font-family: "{font["name"].getBestFamilyName()}";',
+        f"  font-style: {'italic' if font['OS/2'].fsSelection & 1 else 'normal'};",
+        f"  font-weight: {weight};",
+        "  font-display: swap;",
+    ]
+
+    target_dir.mkdir(exist_ok=True, parents=True)
+    paths = []
+    css = [f"/* {source_path.name} split into slices by build.py */"]
+    remaining = set(cmap)
+    for name, ranges in slices.items():
+        codepoints = sorted(u for u in remaining if any(start <= u <= end for start, end in ranges))
+        if not codepoints:
+            continue
+        remaining.difference_update(codepoints)
+        path = target_dir / f"{source_path.stem}-{name}.woff2"
+        print(f"[WOFF2] Subsetting {source_path} to {path} ({len(codepoints)} characters)")
+        options = fontTools.subset.Options(
+            layout_features=["*"],
+            name_IDs=["*"],
+            name_languages=["*"],
+            name_legacy=True,
+            notdef_outline=True,
+            flavor="woff2",
+        )
+        subsetter = fontTools.subset.Subsetter(options)
+        subsetter.populate(unicodes=codepoints + shared)
+        subset = fontTools.ttLib.TTFont(io.BytesIO(data))
+        with measure("fontTools.subset"):
+            subsetter.subset(subset)
+        with brotli_quality(quality), measure("woff2.compress"):
+            fontTools.subset.save_font(subset, os.fspath(path), options)
+        paths.append(path)
+        css.append("@font-face {")
+        css.extend(face)
+        css.append(f'  src: url("{path.name}") format("woff2");')
+        css.append(f"  unicode-range: {css_unicode_range(unicode_ranges(codepoints))};")
+        css.append("}")
+
+    css_path = target_dir / f"{source_path.stem}.css"
+    css_path.write_text("\n".join(css) + "\n")
+    paths.append(css_path)
+    cache_store(cache_dir, key, paths)
+    return paths
+
+
+# Job scheduling
+# ****************************************************************
+
+
+class JobEstimate(NamedTuple):
+    memory: int  # peak RSS in bytes
+    wall: float  # seconds
+
+
+# Peak RSS and wall time of each kind of job, by the glyphs merged into the
+# font, as measured on a Linux build. These are only used for jobs that the
+# report of the previous build (see measured_jobs) doesn't cover.
+JOB_ESTIMATES: Dict[str, Dict[str, JobEstimate]] = {
+    "prepare": {
+        "": JobEstimate(300 * 2**20, 5),
+        "PL": JobEstimate(300 * 2**20, 5),
+        "NF": JobEstimate(300 * 2**20, 5),
+    },
+    "instances": {
+        "": JobEstimate(280 * 2**20, 6),
+        "PL": JobEstimate(280 * 2**20, 6),
+        "NF": JobEstimate(280 * 2**20, 6),
+    },
+    "variable": {
+        "": JobEstimate(200 * 2**20, 10),
+        "PL": JobEstimate(220 * 2**20, 11),
+        "NF": JobEstimate(650 * 2**20, 30),
+    },
+    "vtt": {
+        "": JobEstimate(200 * 2**20, 3),
+        "PL": JobEstimate(220 * 2**20, 3),
+        "NF": JobEstimate(450 * 2**20, 5),
+    },
+    "static": {
+        "": JobEstimate(250 * 2**20, 5),
+        "PL": JobEstimate(260 * 2**20, 6),
+        "NF": JobEstimate(530 * 2**20, 23),
+    },
+    "instance": {
+        "": JobEstimate(150 * 2**20, 1.5),
+        "PL": JobEstimate(150 * 2**20, 1.5),
+        "NF": JobEstimate(200 * 2**20, 5),
+    },
+    "static-diff": {
+        "": JobEstimate(150 * 2**20, 1.5),
+        "PL": JobEstimate(150 * 2**20, 1.5),
+        "NF": JobEstimate(200 * 2**20, 5),
+    },
+    "autohint": {
+        "": JobEstimate(220 * 2**20, 4),
+        "PL": JobEstimate(250 * 2**20, 5),
+        "NF": JobEstimate(470 * 2**20, 25),
+    },
+    "ttfautohint": {
+        "": JobEstimate(100 * 2**20, 5),
+        "PL": JobEstimate(100 * 2**20, 5),
+        "NF": JobEstimate(150 * 2**20, 10),
+    },
+    "woff2": {
+        "": JobEstimate(200 * 2**20, 2),
+        "PL": JobEstimate(200 * 2**20, 2),
+        "NF": JobEstimate(400 * 2**20, 6),
+    },
+    "subsets": {
+        "": JobEstimate(200 * 2**20, 2),
+        "PL": JobEstimate(200 * 2**20, 3),
+        "NF": JobEstimate(400 * 2**20, 6),
+    },
+}
+
+
+def measured_jobs(report_path: Path) -> Dict[str, JobEstimate]:
+    """Peak RSS and wall time of the jobs of the build that wrote the report.
+
+    Jobs that reused outputs from the build cache are left out, their figures
+    say nothing about what the job takes when it has to do the work.
+    """
+    try:
+        records = json.loads(report_path.read_text())["steps"]
+    except (OSError, ValueError, KeyError):
+        return {}
+    return {
+        r["job"]: JobEstimate(r["peak_rss"], r["wall"])
+        for r in records
+        if r["step"] == "total" and r["peak_rss"] is not None and not r.get("cached")
+    }
+
+
+def estimate_job(job: "BuildJob", measured: Dict[str, JobEstimate]) -> JobEstimate:
+    if job.name in measured:
+        return measured[job.name]
+    by_family = JOB_ESTIMATES.get(job.name.split()[0], JOB_ESTIMATES["woff2"])
+    return by_family["NF" if "NF" in job.name else "PL" if "PL" in job.name else ""]
+
+
+def memory_size() -> Optional[int]:
+    """Physical memory in bytes, if the platform tells."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class BuildJob(NamedTuple):
+    name: str
+    function: Callable[..., Any]
+    args: Tuple[Any, ...]
+    # Names of the jobs that have to finish before this one can start.
+    after: Tuple[str, ...] = ()
+    # Called with the job's result, returns the jobs that continue from it.
+    then: Optional[Callable[[Any], List["BuildJob"]]] = None
+
+
+def run_job(
+    name: str,
+    function: Callable[..., Any],
+    args: Tuple[Any, ...],
+    profile_dir: Optional[Path],
+) -> Tuple[Any, List[Dict[str, Any]]]:
+    global CURRENT_JOB, PROFILE_DIR, CACHE_HITS
+    CURRENT_JOB = name
+    PROFILE_DIR = profile_dir
+    CACHE_HITS = 0
+    del STEP_RECORDS[:]
+    wall = time.perf_counter()
+    cpu = cpu_time()
+    result = function(*args)
+    peaks = [r["peak_rss"] for r in STEP_RECORDS if r["peak_rss"] is not None]
+    current_peak = peak_rss()
+    if current_peak is not None:
+        peaks.append(current_peak)
+    STEP_RECORDS.append(
+        {
+            "job": name,
+            "step": "total",
+            "wall": time.perf_counter() - wall,
+            "cpu": cpu_time() - cpu,
+            "peak_rss": max(peaks) if peaks else None,
+            "cached": CACHE_HITS > 0,
+        }
+    )
+    return result, list(STEP_RECORDS)
+
+
+def run_jobs(
+    jobs: List[BuildJob],
+    processes: int,
+    profile_dir: Optional[Path] = None,
+    memory_budget: Optional[int] = None,
+    estimate: Callable[[BuildJob], JobEstimate] = lambda job: JobEstimate(0, 0),
+) -> List[Dict[str, Any]]:
+    """Run jobs on a pool, starting each one as soon as its dependencies are done.
+
+    Only as many jobs as there are processes are handed to the pool at a time.
+    Of the jobs that are ready, the one expected to take longest goes first,
+    so that the build doesn't end waiting on a big font that started late.
+    Among jobs that take as long, follow-up jobs go first, so fonts move
+    through their remaining steps while other fonts are still compiling.
+
+    With a memory budget, a job only starts if its estimated peak memory fits
+    next to that of the running jobs, the longest one that fits if the
+    longest doesn't. When nothing is running, the next job starts regardless.
+    Every job gets a new worker process, so that nothing one job cached or
+    left fragmented adds to the memory of the next.
+    Returns the step measurements of all jobs.
+    """
+    pool = multiprocessing.pool.Pool(processes=processes, maxtasksperchild=1)
+    finished: "queue.Queue[Tuple[BuildJob, Any, Optional[BaseException]]]" = queue.Queue()
+    waiting = list(jobs)
+    done: Set[str] = set()
+    running: Dict[str, int] = {}
+    error: Optional[BaseException] = None
+    records: List[Dict[str, Any]] = []
+
+    while True:
+        while error is None and len(running) < processes:
+            ready = [j for j in waiting if done.issuperset(j.after)]
+            ready.sort(key=lambda j: -estimate(j).wall)
+            job = next(
+                (
+                    j
+                    for j in ready
+                    if memory_budget is None
+                    or not running
+                    or sum(running.values()) + estimate(j).memory <= memory_budget
+                ),
+                None,
+            )
+            if job is None:
+                break
+            waiting.remove(job)
+            pool.apply_async(
+                run_job,
+                (job.name, job.function, job.args, profile_dir),
+                callback=lambda result, job=job: finished.put((job, result, None)),
+                error_callback=lambda e, job=job: finished.put((job, None, e)),
+            )
+            running[job.name] = estimate(job).memory
+        if not running:
+            break
+
+        job, result, job_error = finished.get()
+        del running[job.name]
+        if job_error is not None:
+            print(f"[{job.name}] Failed: {job_error!r}")
+            error = error or job_error
+            continue
+        result, job_records = result
+        records.extend(job_records)
+        done.add(job.name)
+        if job.then is not None:
+            waiting[:0] = job.then(result)
+
+    pool.close()
+    pool.join()
+    if error is not None:
+        raise error
+    if waiting:
+        raise RuntimeError(f"Jobs waiting on jobs that never ran: {[j.name for j in waiting]}")
+    return records
+
+
+def write_build_report(records: List[Dict[str, Any]], path: Path) -> None:
+    summary: Dict[str, Dict[str, Any]] = {}
+    for record in records:
+        step = summary.setdefault(
+            record["step"], {"count": 0, "wall": 0.0, "cpu": 0.0, "peak_rss": None}
+        )
+        step["count"] += 1
+        step["wall"] += record["wall"]
+        step["cpu"] += record["cpu"]
+        if record["peak_rss"] is not None:
+            step["peak_rss"] = max(step["peak_rss"] or 0, record["peak_rss"])
+
+    path.parent.mkdir(exist_ok=True, parents=True)
+    path.write_text(json.dumps({"summary": summary, "steps": records}, indent=2))
+
+    def megabytes(size: Optional[int]) -> str:
+        return "-" if size is None else f"{size / 2**20:.0f} MB"
+
+    print(f"{'Step':<32} {'Runs':>5} {'Wall':>9} {'CPU':>9} {'Peak RSS':>9}")
+    for name, step in sorted(summary.items(), key=lambda item: -item[1]["wall"]):
+        print(
+            f"{name:<32} {step['count']:>5} {step['wall']:>8.1f}s "
+            f"{step['cpu']:>8.1f}s {megabytes(step['peak_rss']):>9}"
+        )
+    print("Slowest jobs:")
+    totals = [r for r in records if r["step"] == "total"]
+    for record in sorted(totals, key=lambda r: -r["wall"])[:5]:
+        print(f"  {record['job']}: {record['wall']:.1f}s, {megabytes(record['peak_rss'])}")
+    print(f"Build report written to {path}")
 
 
 # Main build script
@@ -355,6 +2482,16 @@ if __name__ == "__main__":
     parser.add_argument("-NF", "--no-nerdfonts", action="store_false", dest="nerdfonts")
     parser.add_argument("-M", "--no-mono", action="store_false", dest="mono")
     parser.add_argument("-S", "--static-fonts", action="store_true")
+    parser.add_argument(
+        "--static-from-variable",
+        action="store_true",
+        help="Cut the static TTFs out of the variable fonts instead of compiling them from the UFOs (implies -S). The static OTFs are still compiled from the UFOs.",
+    )
+    parser.add_argument(
+        "--static-diff",
+        action="store_true",
+        help=f"Also cut the static TTFs out of the variable fonts into {OUTPUT_STATIC_TTF_DIR / 'from-variable'} and compare them table by table with the ones compiled from the UFOs (implies -S).",
+    )
     parser.add_argument("-I", "--no-italic", action="store_false", dest="italic")
     parser.add_argument(
         "-V",
@@ -363,8 +2500,60 @@ if __name__ == "__main__":
         dest="vtt_compile",
         help="Do not compile VTT code but leave in the VTT sources.",
     )
+    parser.add_argument(
+        "--serial-vtt",
+        action="store_false",
+        dest="parallel_vtt",
+        help="Compile the VTT code of each variable font in one job instead of spreading it over all processes.",
+    )
     parser.add_argument("-W", "--web-fonts", action="store_true")
+    parser.add_argument(
+        "--web-subsets",
+        action="store_true",
+        help="Also split the web fonts into WOFF2 slices by script and icon set, with a CSS file that loads them by unicode-range.",
+    )
+    parser.add_argument(
+        "--woff2-quality",
+        type=int,
+        choices=range(12),
+        default=WOFF2_QUALITY,
+        metavar="0-11",
+        help="Brotli quality of the WOFF2 files, lower is faster but bigger (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--report",
+        type=Path,
+        default=OUTPUT_DIR / "report.json",
+        help="Where to write the per-step timings and memory use (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"Dump a cProfile file for every step into {OUTPUT_DIR / 'profile'}.",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        metavar="GB",
+        help="Only start jobs while their estimated memory use fits in this many GB (default: 80%% of the physical memory).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_false",
+        dest="cache",
+        help="Rebuild every font instead of reusing unchanged outputs from the build cache.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=CACHE_DIR,
+        help=f"Where to keep the build cache (default: {CACHE_DIR}).",
+    )
     args = parser.parse_args()
+    if args.static_from_variable and args.static_diff:
+        parser.error("--static-from-variable and --static-diff cannot be combined")
+    if args.static_from_variable or args.static_diff:
+        args.static_fonts = True
 
     # Load Designspace and filter out instances that are marked as non-exportable.
     designspace = fontTools.designspaceLib.DesignSpaceDocument.fromfile(
@@ -388,332 +2577,425 @@ if __name__ == "__main__":
     ]
 
 
-    #Stage 1: Make all the things.
-    pool = multiprocessing.pool.Pool(processes=multiprocessing.cpu_count())
-    processes = []
-    processes.append(
-        pool.apply_async(
-            build_font_variable,
-            (
-                designspace,
-                "Cascadia Code",
-                args.vtt_compile,
-            ),
-        )
-    )
+    cache_dir = args.cache_dir if args.cache else None
+
+    # Only the Code families are compiled, each Mono family is derived from
+    # its Code counterpart by the same job.
+    families = ["Cascadia Code"]
+    if args.powerline:
+        families.append("Cascadia Code PL")
+    if args.nerdfonts:
+        families.append("Cascadia Code NF")
+
+    styles = [(designspace, "")]
     if args.italic:
-        processes.append(
-            pool.apply_async(
-                build_font_variable,
-                (
-                    designspaceItalic,
-                    "Cascadia Code Italic",
-                    args.vtt_compile,
-                ),
-            )
+        styles.append((designspaceItalic, " Italic"))
+
+    variable_jobs = [
+        (style_designspace, family + suffix)
+        for family in families
+        for style_designspace, suffix in styles
+    ]
+    static_jobs = []
+    # With --static-from-variable, the UFO-compiled statics are only the OTFs.
+    static_formats = ("otf",) if args.static_from_variable else ("ttf", "otf")
+    if args.static_fonts:
+        static_jobs = [
+            (style_designspace, instance_descriptor, family + suffix)
+            for style_designspace, suffix in styles
+            for instance_descriptor in style_designspace.instances
+            for family in families
+        ]
+
+    # Interpolate all instances of a family that aren't cached in one job, so
+    # that the masters are read and the instantiator set up once. Each
+    # instance is then compiled by a job of its own. Only the variable font
+    # needs the Powerline and Nerd Fonts glyphs merged into the masters.
+    uncached: Dict[
+        str,
+        Tuple[
+            fontTools.designspaceLib.DesignSpaceDocument,
+            List[fontTools.designspaceLib.InstanceDescriptor],
+        ],
+    ] = {}
+
+    def static_cache_keys(
+        style_designspace: fontTools.designspaceLib.DesignSpaceDocument,
+        instance_descriptor: fontTools.designspaceLib.InstanceDescriptor,
+        name: str,
+    ) -> List[str]:
+        return [
+            static_cache_key(style_designspace, instance_descriptor, family, static_formats)
+            for family in family_names(name, args.mono)
+        ]
+
+    for style_designspace, instance_descriptor, name in static_jobs:
+        keys = static_cache_keys(style_designspace, instance_descriptor, name)
+        if not all(cache_contains(cache_dir, key) for key in keys):
+            uncached.setdefault(name, (style_designspace, []))[1].append(instance_descriptor)
+
+    instances_dir = tempfile.TemporaryDirectory()
+
+    def variable_cache_keys(
+        style_designspace: fontTools.designspaceLib.DesignSpaceDocument, name: str
+    ) -> List[str]:
+        return [
+            variable_cache_key(style_designspace, family, args.vtt_compile)
+            for family in family_names(name, args.mono)
+        ]
+
+    # A family whose variable font and static instances both get compiled
+    # has its masters prepared once, by a job of its own, for both to load.
+    prepared: Dict[str, Path] = {
+        name: Path(instances_dir.name) / f"{name} masters.pickle"
+        for style_designspace, name in variable_jobs
+        if name in uncached
+        and not all(
+            cache_contains(cache_dir, key)
+            for key in variable_cache_keys(style_designspace, name)
         )
-    if args.mono:
-        processes.append(
-            pool.apply_async(
-                build_font_variable,
-                (
-                    designspace,
-                    "Cascadia Mono",
-                    args.vtt_compile,
-                ),
+    }
+
+    # Every font moves on to its next step as soon as it is ready, rather than
+    # waiting for all other fonts to finish the current stage.
+    def web_font_jobs(ttf_path: Path) -> List[BuildJob]:
+        jobs = []
+        # This removes build/ttf from the path and prepends build/woff2
+        # instead, keeping the sub-structure.
+        woff2_path = OUTPUT_WOFF2_DIR / ttf_path.relative_to(OUTPUT_TTF_DIR).with_suffix(".woff2")
+        if args.web_fonts:
+            jobs.append(
+                BuildJob(
+                    f"woff2 {ttf_path}",
+                    to_woff2,
+                    (ttf_path, woff2_path, args.woff2_quality, cache_dir),
+                )
+            )
+        if args.web_subsets:
+            subsets_dir = OUTPUT_WOFF2_DIR / "subsets" / ttf_path.relative_to(OUTPUT_TTF_DIR).parent
+            jobs.append(
+                BuildJob(
+                    f"subsets {ttf_path}",
+                    subset_web_font,
+                    (ttf_path, subsets_dir, args.woff2_quality, cache_dir),
+                )
             )
+        return jobs
+
+    # Leave some memory to the system and the main process. Without a
+    # budget, there is one process per CPU as before.
+    memory_budget = None
+    if args.memory_budget is not None:
+        memory_budget = int(args.memory_budget * 2**30)
+    elif memory_size() is not None:
+        memory_budget = int(memory_size() * 0.8)
+    measured = measured_jobs(args.report)
+
+    def estimate(job: BuildJob) -> JobEstimate:
+        return estimate_job(job, measured)
+
+    # More processes than the smallest compile job fits into the budget would
+    # only sit idle.
+    processes = multiprocessing.cpu_count()
+    if memory_budget is not None:
+        smallest = min(
+            e.memory for kind in ("variable", "static") for e in JOB_ESTIMATES[kind].values()
         )
-        if args.italic:
-            processes.append(
-                pool.apply_async(
-                    build_font_variable,
+        processes = max(1, min(processes, memory_budget // smallest))
+
+    # The variable fonts are saved with their VTT sources, and the glyph
+    # programs compiled in chunks spread over the pool. The chunk jobs get
+    # the glyphs' TSI1 programs from the variable job rather than reading the
+    # font. Once all chunks of a font are done, one last job loads the font,
+    # puts the compiled glyph programs in and saves it again.
+    vtt_chunks = processes
+    parallel_vtt = args.vtt_compile and args.parallel_vtt and vtt_chunks > 1
+
+    # A Mono font has the same glyphs and VTT sources as its Code counterpart,
+    # so the glyph programs compiled for one go into both.
+    def vtt_jobs(
+        result: Tuple[List[Path], List[str], Dict[str, str]],
+        keys: List[str],
+        thens: List[Callable[[Path], List[BuildJob]]],
+    ) -> List[BuildJob]:
+        vtt_paths, glyph_order, glyph_programs = result
+        programs: Dict[str, Tuple[Any, List[Any]]] = {}
+        finished: List[int] = []
+
+        def chunk_done(chunk: int, result: Dict[str, Tuple[Any, List[Any]]]) -> List[BuildJob]:
+            programs.update(result)
+            finished.append(chunk)
+            if len(finished) < vtt_chunks:
+                return []
+            return [
+                BuildJob(
+                    f"vtt {vtt_path}",
+                    compile_vtt_and_save,
+                    (vtt_path, glyph_order, programs, cache_dir, key),
+                    then=then,
+                )
+                for vtt_path, key, then in zip(vtt_paths, keys, thens)
+            ]
+
+        jobs = []
+        for chunk in range(vtt_chunks):
+            # Every vtt_chunks-th glyph, so that big composites spread out.
+            chunk_order = glyph_order[chunk::vtt_chunks]
+            jobs.append(
+                BuildJob(
+                    f"vtt {vtt_paths[0]} {chunk + 1}/{vtt_chunks}",
+                    compile_vtt_glyph_programs,
                     (
-                        designspaceItalic,
-                        "Cascadia Mono Italic",
-                        args.vtt_compile,
+                        chunk_order,
+                        {n: glyph_programs[n] for n in chunk_order if n in glyph_programs},
                     ),
+                    then=lambda result, chunk=chunk: chunk_done(chunk, result),
                 )
             )
-    if args.powerline:
-        processes.append(
-            pool.apply_async(
-                build_font_variable,
+        return jobs
+
+    # Static TTFs cut out of the variable fonts go where the UFO-compiled ones
+    # would, or next to them to be compared.
+    derived_static_dir: Optional[Path] = None
+    if args.static_from_variable:
+        derived_static_dir = OUTPUT_STATIC_TTF_DIR
+    elif args.static_diff:
+        derived_static_dir = OUTPUT_STATIC_TTF_DIR / "from-variable"
+    static_diffs: List[Dict[str, Any]] = []
+
+    def instance_jobs(
+        style_designspace: fontTools.designspaceLib.DesignSpaceDocument,
+        name: str,
+        variable_path: Path,
+    ) -> List[BuildJob]:
+        return [
+            BuildJob(
+                f"instance {name} {instance_descriptor.styleName}",
+                instance_static_and_save,
                 (
-                    designspace,
-                    "Cascadia Code PL",
-                    args.vtt_compile,
+                    variable_path,
+                    style_designspace,
+                    instance_descriptor,
+                    name,
+                    derived_static_dir,
+                    cache_dir,
                 ),
+                then=static_ttf_jobs if args.static_from_variable else None,
             )
-        )
-        if args.italic:
-            processes.append(
-                pool.apply_async(
-                    build_font_variable,
-                    (
-                        designspaceItalic,
-                        "Cascadia Code PL Italic",
-                        args.vtt_compile,
-                    ),
-                )
+            for instance_descriptor in style_designspace.instances
+        ]
+
+    def variable_font_jobs(
+        style_designspace: fontTools.designspaceLib.DesignSpaceDocument, name: str
+    ) -> Callable[[Path], List[BuildJob]]:
+        def then(ttf_path: Path) -> List[BuildJob]:
+            jobs = web_font_jobs(ttf_path)
+            if derived_static_dir is not None:
+                jobs.extend(instance_jobs(style_designspace, name, ttf_path))
+            return jobs
+
+        return then
+
+    def variable_fonts_jobs(
+        style_designspace: fontTools.designspaceLib.DesignSpaceDocument, name: str
+    ) -> Callable[[List[Path]], List[BuildJob]]:
+        def then(paths: List[Path]) -> List[BuildJob]:
+            jobs = []
+            for family, path in zip(family_names(name, args.mono), paths):
+                jobs.extend(variable_font_jobs(style_designspace, family)(path))
+            return jobs
+
+        return then
+
+    def static_diff_done(diff: Dict[str, Any]) -> List[BuildJob]:
+        static_diffs.append(diff)
+        return []
+
+    reference_ttf_path = OUTPUT_STATIC_TTF_DIR / "CascadiaCode-Regular.ttf"
+    reference_ttf_job = (
+        "instance Cascadia Code Regular"
+        if args.static_from_variable
+        else "static Cascadia Code Regular"
+    )
+    has_ttfautohint = shutil.which("ttfautohint") is not None
+    if args.static_fonts and not has_ttfautohint:
+        print("ttfautohint not found, static TTFs will not be hinted. Please reinstall and try again.")
+    unhinted: List[Path] = []
+
+    def hinted_font_jobs(ttf_path: Path, error: Optional[str]) -> List[BuildJob]:
+        if error is not None:
+            print(f"[{ttf_path.name}] ttfautohint failed, leaving it unhinted: {error}")
+            unhinted.append(ttf_path)
+        return web_font_jobs(ttf_path)
+
+    def static_ttf_jobs(ttf_path: Path) -> List[BuildJob]:
+        if not has_ttfautohint:
+            return web_font_jobs(ttf_path)
+        # Every ttfautohint run reads the reference font. Waiting for it to be
+        # hinted, not just compiled, means all of them read the same file.
+        after: Tuple[str, ...] = ()
+        if ttf_path != reference_ttf_path:
+            after = (reference_ttf_job, f"ttfautohint {reference_ttf_path}")
+        return [
+            BuildJob(
+                f"ttfautohint {ttf_path}",
+                try_ttfautohint,
+                (os.fspath(ttf_path), cache_dir),
+                after=after,
+                then=lambda error: hinted_font_jobs(ttf_path, error),
             )
-        if args.mono:
-            processes.append(
-                pool.apply_async(
-                    build_font_variable,
-                    (
-                        designspace,
-                        "Cascadia Mono PL",
-                        args.vtt_compile,
-                    ),
-                )
+        ]
+
+    def static_font_jobs(paths: List[Path]) -> List[BuildJob]:
+        jobs = []
+        for path in paths:
+            if path.suffix == ".otf":
+                jobs.append(BuildJob(f"autohint {path}", autohint, (path, cache_dir)))
+            else:
+                jobs.extend(static_ttf_jobs(path))
+        return jobs
+
+    def static_instance_jobs(name: str, paths: List[Path]) -> List[BuildJob]:
+        style_designspace, instance_descriptors = uncached[name]
+        return [
+            BuildJob(
+                f"static {name} {instance_descriptor.styleName}",
+                build_font_static_instance,
+                (
+                    path,
+                    name,
+                    cache_dir,
+                    static_cache_keys(style_designspace, instance_descriptor, name),
+                    static_formats,
+                ),
+                then=static_font_jobs,
             )
-            if args.italic:
-                processes.append(
-                    pool.apply_async(
-                        build_font_variable,
-                        (
-                            designspaceItalic,
-                            "Cascadia Mono PL Italic",
-                            args.vtt_compile,
-                        ),
+            for instance_descriptor, path in zip(instance_descriptors, paths)
+        ]
+
+    def prepared_after(name: str) -> Tuple[str, ...]:
+        return (f"prepare {name}",) if name in prepared else ()
+
+    jobs = [
+        BuildJob(
+            f"prepare {name}",
+            save_prepared_fonts,
+            (style_designspace, name, prepared[name]),
+        )
+        for style_designspace, name in variable_jobs
+        if name in prepared
+    ]
+    jobs.extend(
+        BuildJob(
+            f"instances {name}",
+            save_static_instances,
+            (
+                style_designspace,
+                name,
+                [i.styleName for i in instance_descriptors],
+                Path(instances_dir.name),
+                prepared.get(name),
+            ),
+            after=prepared_after(name),
+            then=lambda paths, name=name: static_instance_jobs(name, paths),
+        )
+        for name, (style_designspace, instance_descriptors) in uncached.items()
+    )
+    for style_designspace, name in variable_jobs:
+        if parallel_vtt:
+            keys = variable_cache_keys(style_designspace, name)
+            if not all(cache_contains(cache_dir, key) for key in keys):
+                thens = [
+                    variable_font_jobs(style_designspace, family)
+                    for family in family_names(name, args.mono)
+                ]
+                jobs.append(
+                    BuildJob(
+                        f"variable {name}",
+                        build_font_variable_vtt_sources,
+                        (style_designspace, name, args.mono, prepared.get(name)),
+                        after=prepared_after(name),
+                        then=lambda result, keys=keys, thens=thens: vtt_jobs(result, keys, thens),
                     )
                 )
-    if args.nerdfonts:
-        processes.append(
-            pool.apply_async(
+                continue
+        jobs.append(
+            BuildJob(
+                f"variable {name}",
                 build_font_variable,
                 (
-                    designspace,
-                    "Cascadia Code NF",
+                    style_designspace,
+                    name,
                     args.vtt_compile,
+                    cache_dir,
+                    args.mono,
+                    prepared.get(name),
                 ),
+                after=prepared_after(name),
+                then=variable_fonts_jobs(style_designspace, name),
             )
         )
-        if args.italic:
-            processes.append(
-                pool.apply_async(
-                    build_font_variable,
-                    (
-                        designspaceItalic,
-                        "Cascadia Code NF Italic",
-                        args.vtt_compile,
-                    ),
-                )
-            )
-        if args.mono:
-            processes.append(
-                pool.apply_async(
-                    build_font_variable,
-                    (
-                        designspace,
-                        "Cascadia Mono NF",
-                        args.vtt_compile,
-                    ),
-                )
-            )
-            if args.italic:
-                processes.append(
-                    pool.apply_async(
-                        build_font_variable,
-                        (
-                            designspaceItalic,
-                            "Cascadia Mono NF Italic",
-                            args.vtt_compile,
-                        ),
-                    )
-                )
-
-    if args.static_fonts:
-        # Build the Regulars
-        for instance_descriptor in designspace.instances:
-            processes.append(
-                pool.apply_async(
+    for style_designspace, instance_descriptor, name in static_jobs:
+        if instance_descriptor not in uncached.get(name, (None, []))[1]:
+            # Only restores the fonts from the cache.
+            jobs.append(
+                BuildJob(
+                    f"static {name} {instance_descriptor.styleName}",
                     build_font_static,
                     (
-                        designspace,
+                        style_designspace,
                         instance_descriptor,
-                        "Cascadia Code",
+                        name,
+                        cache_dir,
+                        static_formats,
+                        args.mono,
                     ),
+                    then=static_font_jobs,
                 )
             )
-            if args.mono:
-                processes.append(
-                    pool.apply_async(
-                        build_font_static,
-                        (
-                            designspace,
-                            instance_descriptor,
-                            "Cascadia Mono",
-                        ),
+        if args.static_diff:
+            # Compare with the UFO-compiled TTF once ttfautohint is done with it.
+            style_name = instance_descriptor.styleName
+            for family in family_names(name, args.mono):
+                file_name = static_file_name(family.replace(" Italic", ""), style_name)
+                ttf_path = (OUTPUT_STATIC_TTF_DIR / file_name).with_suffix(".ttf")
+                after = (f"static {name} {style_name}", f"instance {family} {style_name}")
+                if has_ttfautohint:
+                    after += (f"ttfautohint {ttf_path}",)
+                jobs.append(
+                    BuildJob(
+                        f"static-diff {family} {style_name}",
+                        static_diff,
+                        (ttf_path, (derived_static_dir / file_name).with_suffix(".ttf")),
+                        after=after,
+                        then=static_diff_done,
                     )
                 )
-            if args.powerline:
-                processes.append(
-                    pool.apply_async(
-                        build_font_static,
-                        (
-                            designspace,
-                            instance_descriptor,
-                            "Cascadia Code PL",
-                        ),
-                    )
-                )
-                if args.mono:
-                    processes.append(
-                        pool.apply_async(
-                            build_font_static,
-                            (
-                                designspace,
-                                instance_descriptor,
-                                "Cascadia Mono PL",
-                            ),
-                        )
-                    )
-            if args.nerdfonts:
-                processes.append(
-                    pool.apply_async(
-                        build_font_static,
-                        (
-                            designspace,
-                            instance_descriptor,
-                            "Cascadia Code NF",
-                        ),
-                    )
-                )
-                if args.mono:
-                    processes.append(
-                        pool.apply_async(
-                            build_font_static,
-                            (
-                                designspace,
-                                instance_descriptor,
-                                "Cascadia Mono NF",
-                            ),
-                        )
-                    )
-        if args.italic:
-            # Build the Regulars
-            for instance_descriptor in designspaceItalic.instances:
-                processes.append(
-                    pool.apply_async(
-                        build_font_static,
-                        (
-                            designspaceItalic,
-                            instance_descriptor,
-                            "Cascadia Code Italic",
-                        ),
-                    )
-                )
-                if args.mono:
-                    processes.append(
-                        pool.apply_async(
-                            build_font_static,
-                            (
-                                designspaceItalic,
-                                instance_descriptor,
-                                "Cascadia Mono Italic",
-                            ),
-                        )
-                    )
-                if args.powerline:
-                    processes.append(
-                        pool.apply_async(
-                            build_font_static,
-                            (
-                                designspaceItalic,
-                                instance_descriptor,
-                                "Cascadia Code PL Italic",
-                            ),
-                        )
-                    )
-                    if args.mono:
-                        processes.append(
-                            pool.apply_async(
-                                build_font_static,
-                                (
-                                    designspaceItalic,
-                                    instance_descriptor,
-                                    "Cascadia Mono PL Italic",
-                                ),
-                            )
-                        )
-                if args.nerdfonts:
-                    processes.append(
-                        pool.apply_async(
-                            build_font_static,
-                            (
-                                designspaceItalic,
-                                instance_descriptor,
-                                "Cascadia Code NF Italic",
-                            ),
-                        )
-                    )
-                    if args.mono:
-                        processes.append(
-                            pool.apply_async(
-                                build_font_static,
-                                (
-                                    designspaceItalic,
-                                    instance_descriptor,
-                                    "Cascadia Mono NF Italic",
-                                ),
-                            )
-                        )
-
-    pool.close()
-    pool.join()
-    for process in processes:
-        process.get()
-    del processes, pool
-
-    # Step 1.5: Adding STAT tables in one go
-    print ("[Cascadia Variable fonts] Fixing STAT tables")
-    fontSTAT = [fontTools.ttLib.TTFont(f) for f in list(OUTPUT_TTF_DIR.glob("*.ttf"))]
-    with open(INPUT_DIR/"stat.yaml") as f:
-        config = yaml.load(f, Loader=yaml.SafeLoader)
-    gen_stat_tables_from_config(config, fontSTAT)
-
-    for font in fontSTAT:
-        font.save(font.reader.file.name)
-
-    # Stage 2: Autohint and maybe compress all the static things.
-    if args.static_fonts is True:
-        otfs = list(OUTPUT_STATIC_OTF_DIR.glob("*.otf"))
-        if otfs:
-            pool = multiprocessing.Pool(processes=multiprocessing.cpu_count())
-            processes = [pool.apply_async(autohint, (otf,)) for otf in otfs]
-            pool.close()
-            pool.join()
-            for process in processes:
-                process.get()
-            del processes, pool
-
-        try:
-            for ttf_path in OUTPUT_STATIC_TTF_DIR.glob("*.ttf"):
-                if not ttf_path.stem.endswith("-hinted"):
-                    ttfautohint(os.fspath(ttf_path))
-        except Exception as e:
-            print(f"ttfautohint failed. Please reinstall and try again. {str(e)}")
 
-    # Stage 3: Have some web fonts.
-    if args.web_fonts:
-        pool = multiprocessing.Pool(processes=multiprocessing.cpu_count())
-        processes = [
-            pool.apply_async(
-                to_woff2,
-                (
-                    path,
-                    # This removes build/ttf from the found files and prepends
-                    # build/woff2 instead, keeping the sub-structure.
-                    OUTPUT_WOFF2_DIR
-                    / path.relative_to(OUTPUT_TTF_DIR).with_suffix(".woff2"),
-                ),
-            )
-            for path in OUTPUT_TTF_DIR.glob("**/*.ttf")
-        ]
-        pool.close()
-        pool.join()
-        for process in processes:
-            process.get()
+    # The Nerd Fonts merge and the web font slices read the processed UFOs
+    # through the glyph pack.
+    if args.nerdfonts or args.web_subsets:
+        update_glyph_pack()
+
+    # Forked workers inherit these, spawned ones load them when needed.
+    for style_designspace, name in variable_jobs:
+        load_vtt_data(ITALIC_VTT_DATA_FILE if "Italic" in name else VTT_DATA_FILE)
+
+    records = run_jobs(
+        jobs,
+        processes,
+        OUTPUT_DIR / "profile" if args.profile else None,
+        memory_budget,
+        estimate,
+    )
+    instances_dir.cleanup()
+    write_build_report(records, args.report)
+    if static_diffs:
+        write_static_diff_report(static_diffs, OUTPUT_DIR / "static-diff.json")
+
+    if unhinted:
+        print(f"ttfautohint failed for {len(unhinted)} fonts, they are not hinted:")
+        for ttf_path in unhinted:
+            print(f"  {ttf_path}")
 
     print("All done.")
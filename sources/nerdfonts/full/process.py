@@ -1,230 +1,519 @@
-from fontParts.world import OpenFont
-import fontParts
-import glob
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
 from pathlib import Path
 
+import ufoLib2
+import ufoLib2.objects
+from fontPens.flattenPen import FlattenPen
+from fontTools.misc.arrayTools import sectRect
+from fontTools.misc.roundTools import otRound
+from fontTools.ufoLib.glifLib import GlyphSet
+from fontTools.pens.areaPen import AreaPen
+from fontTools.pens.boundsPen import BoundsPen
+from fontTools.pens.pointInsidePen import PointInsidePen
+from fontTools.pens.pointPen import ReverseContourPointPen
+from fontTools.pens.basePen import BasePen
+from fontTools.pens.recordingPen import RecordingPen, replayRecording
+from fontTools.pens.transformPen import TransformPen
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
 SIDEBEARING = 20
 FONTWIDTH = 1200
 FONTHEIGHT = 1420 #height baseline to cap height for centering of symbol
 FONTUPM = 2048
+FULLHEIGHT = 2706 #height of the full height Powerline glyphs
 
 INPUT = Path("original")
 OUTPUT = Path("processed")
+# Per glyph the hash of its source .glif, the reference glyphs its scale
+# group used and the fingerprint of its glyphRule, to only reprocess what
+# changed. Bump the version when processing changes in a way glyphRule
+# doesn't describe, like a new step for every glyph.
+MANIFEST = OUTPUT / "manifest.json"
+MANIFEST_VERSION = 2
 
 
-CLOUDS = [0xE300, 0xE301, 0xE302, 0xE303, 0xE304, 0xE305, 0xE306, 0xE307, 0xE308, 0xE309, 0xE30A, 0xE30B, 0xE30C, 0xE30D, 0xE30E, 0xE30F, 0xE310, 0xE311, 0xE312, 0xE313, 0xE314, 0xE315, 0xE316, 0xE317, 0xE318, 0xE319, 0xE31A, 0xE31B, 0xE31C, 0xE31D, 0xE31E, 0xE31F, 0xE320, 0xE321, 0xE322, 0xE323, 0xE324, 0xE325, 0xE326, 0xE327, 0xE328, 0xE329, 0xE32A, 0xE32B, 0xE32C, 0xE32D, 0xE32E, 0xE32F, 0xE330, 0xE331, 0xE332, 0xE333, 0xE334, 0xE335, 0xE336, 0xE337, 0xE338, 0xE33A, 0xE33B, 0xE33C, 0xE33D, 0xE342, 0xE343, 0xE346, 0xE34B, 0xE34C, 0xE34D, 0xE35C, 0xE35D, 0xE35E, 0xE35F, 0xE360, 0xE361, 0xE362, 0xE363, 0xE364, 0xE365, 0xE366, 0xE367, 0xE36A, 0xE36B, 0xE36C, 0xE36D, 0xE36E, 0xE36F, 0xE370, 0xE371, 0xE372, 0xE373, 0xE374, 0xE375, 0xE376, 0xE377, 0xE378, 0xE379, 0xE37A, 0xE37B, 0xE37C, 0xE37D, 0xE37E, 0xE3AA, 0xE3AB, 0xE3AC, 0xE3AD, 0xE3AE, 0xE3BC, 0xE3BD, 0xE3BE, 0xE3BF, 0xE3C0, 0xE3C1, 0xE3C2, 0xE3C3, 0xE345,0xE34A,0xE351]
+CLOUDS = {0xE300, 0xE301, 0xE302, 0xE303, 0xE304, 0xE305, 0xE306, 0xE307, 0xE308, 0xE309, 0xE30A, 0xE30B, 0xE30C, 0xE30D, 0xE30E, 0xE30F, 0xE310, 0xE311, 0xE312, 0xE313, 0xE314, 0xE315, 0xE316, 0xE317, 0xE318, 0xE319, 0xE31A, 0xE31B, 0xE31C, 0xE31D, 0xE31E, 0xE31F, 0xE320, 0xE321, 0xE322, 0xE323, 0xE324, 0xE325, 0xE326, 0xE327, 0xE328, 0xE329, 0xE32A, 0xE32B, 0xE32C, 0xE32D, 0xE32E, 0xE32F, 0xE330, 0xE331, 0xE332, 0xE333, 0xE334, 0xE335, 0xE336, 0xE337, 0xE338, 0xE33A, 0xE33B, 0xE33C, 0xE33D, 0xE342, 0xE343, 0xE346, 0xE34B, 0xE34C, 0xE34D, 0xE35C, 0xE35D, 0xE35E, 0xE35F, 0xE360, 0xE361, 0xE362, 0xE363, 0xE364, 0xE365, 0xE366, 0xE367, 0xE36A, 0xE36B, 0xE36C, 0xE36D, 0xE36E, 0xE36F, 0xE370, 0xE371, 0xE372, 0xE373, 0xE374, 0xE375, 0xE376, 0xE377, 0xE378, 0xE379, 0xE37A, 0xE37B, 0xE37C, 0xE37D, 0xE37E, 0xE3AA, 0xE3AB, 0xE3AC, 0xE3AD, 0xE3AE, 0xE3BC, 0xE3BD, 0xE3BE, 0xE3BF, 0xE3C0, 0xE3C1, 0xE3C2, 0xE3C3, 0xE345,0xE34A,0xE351}
 
 #scale groups
-
-def scaleGroup(fileName, glyph, SIDEBEARING):
-	xAdjustment = 1
-	yAdjustment = 1
-	height = glyph.bounds[3] - glyph.bounds[1]
-	width = glyph.bounds[2] - glyph.bounds[0]
-	modified = False
-
-	if "codicon" in fileName:
-		if glyph.unicode in range(0xeb6e,0xeb72): #triangles
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["triangle-down"].bounds[2] - scaledFont["triangle-down"].bounds[0])
-			modified = True
-		if glyph.unicode in range(0xeab4,0xeab8): #chevrons
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["chevron-down"].bounds[2] - scaledFont["chevron-down"].bounds[0])
-			modified = True
-		if glyph.unicode in [0xEA9D,0xEA9E,0xEA9F,0xEAA0]:
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["arrow-both"].bounds[2] - scaledFont["arrow-both"].bounds[0])
-			modified = True
-
-	elif "devicons" in fileName:
-		if glyph.unicode in range(0xe7bd,0xe7c4): #small letters
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["uniE60E"].bounds[2] - scaledFont["uniE60E"].bounds[0])
-			modified = True
-
-	elif "FontAwesome" in fileName:
-		if glyph.unicode in [0xf005, 0xf006, 0xf089]: #star
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["star"].bounds[2] - scaledFont["star"].bounds[0])
-			modified = True
-		if glyph.unicode in range(0xF026,0xF029): #volume
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["volume_up"].bounds[2] - scaledFont["volume_up"].bounds[0])
-			modified = True
-		if glyph.unicode in [0xf02b, 0xf02c]: #tags
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["tags"].bounds[2] - scaledFont["tags"].bounds[0])
-			modified = True
-		if glyph.unicode in range(0xF031,0xF036): #font stuff
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["text_height"].bounds[2] - scaledFont["text_height"].bounds[0])
-			modified = True
-		if glyph.unicode in [0xf044, 0xf045, 0xf046]: #edit share check boxes
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["edit"].bounds[2] - scaledFont["edit"].bounds[0])
-			modified = True
-		if glyph.unicode in range(0xF048,0xF053): #multimedia buttons
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["fast_forward"].bounds[2] - scaledFont["fast_forward"].bounds[0])
-			modified = True
-		if glyph.unicode in range(0xF060,0xF064): #arrows
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["arrow_up"].bounds[2] - scaledFont["arrow_up"].bounds[0])
-			modified = True
-		if glyph.unicode in [0xf053, 0xf054, 0xf077, 0xf078]: #chevron all directions
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["chevron_up"].bounds[2] - scaledFont["chevron_up"].bounds[0])
-			modified = True
-		if glyph.unicode in [0xF07D,0xF07E]: #resize
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["resize_horizontal"].bounds[2] - scaledFont["resize_horizontal"].bounds[0])
-			modified = True
-		if glyph.unicode in [0xf0a4, 0xf0a5, 0xf0a6, 0xf0a7]: #pointing hands
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["hand_right"].bounds[2] - scaledFont["hand_right"].bounds[0])
-			modified = True
-		if glyph.unicode in [0xf0d7, 0xf0d8, 0xf0d9, 0xf0da, 0xf0dc, 0xf0dd, 0xf0de]: #carets all directions
-			xAdjustment = FONTHEIGHT/(scaledFont["sort"].bounds[3] - scaledFont["sort"].bounds[1])
-			modified = True
-		if glyph.unicode in range(0xF100,0xF108): #angle
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["double_angle_up"].bounds[2] - scaledFont["double_angle_up"].bounds[0])
-			modified = True
-		if glyph.unicode in [0xF130,0xF131]: #mic
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["microphone_off"].bounds[2] - scaledFont["microphone_off"].bounds[0])
-			modified = True
-		if glyph.unicode in [0xF141,0xF142]: #ellipsis
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["ellipsis_horizontal"].bounds[2] - scaledFont["ellipsis_horizontal"].bounds[0])
-			modified = True
-		if glyph.unicode in range(0xF153,0xF15b): #currencies
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["krw"].bounds[2] - scaledFont["krw"].bounds[0])
-			modified = True
-		if glyph.unicode in range(0xF157,0xF179): #long arrows
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["long_arrow_left"].bounds[2] - scaledFont["long_arrow_left"].bounds[0])
-			modified = True
-		if glyph.unicode in [0xF182,0xF183]: #male and female
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["female"].bounds[2] - scaledFont["female"].bounds[0])
-			modified = True
-		if glyph.unicode in range(0xF221,0xF22E): #gender or so
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["_517"].bounds[2] - scaledFont["_517"].bounds[0])
-			modified = True
-		if glyph.unicode in range(0xF255,0xF25C): #hand symbols
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["_563"].bounds[2] - scaledFont["_563"].bounds[0])
-			modified = True
-
-	elif "octicons" in fileName:
-		if glyph.unicode in [0xF476,0xF478,0xF49A]: #bells
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["bell-slash"].bounds[2] - scaledFont["bell-slash"].bounds[0])
-			modified = True
-		if glyph.unicode in range(0xF4EF,0xF4F3): #move to
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["move-to-end"].bounds[2] - scaledFont["move-to-top"].bounds[0])
-			modified = True
-		if glyph.unicode in [0xF461,0xF47A,0xF493,0xF533]: #bookmarks
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["bookmark-slash"].bounds[2] - scaledFont["bookmark-slash"].bounds[0])
-			modified = True
-		if glyph.unicode in [0xF416,0xF424,0xF431,0xF432,0xF433,0xF434,0xF43E,0xF443,0xF45C,0xF46C]: #arrows
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["arrow-both"].bounds[2] - scaledFont["arrow-both"].bounds[0])
-			modified = True
-		if glyph.unicode in [0xF438,0xF444,0xF445,0xF44A,0xF44B,0xF460,0xF467,0xF470,0xF47B,0xF47C,0xF47D,0xF47E,0xF48B,0xF4C3,0xF51D]: #triangles / small stuff / chevrons / dash / X / github-text
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["smiley"].bounds[2] - scaledFont["smiley"].bounds[0])
-			modified = True
-
-	elif "weather" in fileName:
-		if glyph.unicode in CLOUDS: # Various
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["uniF003"].bounds[2] - scaledFont["uniF003"].bounds[0])
-			modified = True
-		if glyph.unicode in [0xE339, 0xE33E, 0xE341]: # degree signs
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["uniF045"].bounds[2] - scaledFont["uniF045"].bounds[0])
-			modified = True
-		if glyph.unicode in [0xE33F, 0xE340, 0xE344, 0xE347, 0xE348, 0xE349, 0xE352, 0xE353, 0xE37F, 0xE380]: # arrows
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["uniF04C"].bounds[2] - scaledFont["uniF04C"].bounds[0])
-			modified = True
-		if glyph.unicode in range(0xE34E,0xE351): # thermometers
-			xAdjustment = FONTHEIGHT/(scaledFont["uniF053"].bounds[3] - scaledFont["uniF053"].bounds[1])
-			modified = True
-		if glyph.unicode in range(0xE38D,0xE3A9): # moon phases
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["uniF095"].bounds[2] - scaledFont["uniF095"].bounds[0])
-			modified = True
-		if glyph.unicode in range(0xE3AF,0xE3BC): # wind speed
-			#xAdjustment = (FONTHEIGHT)/(scaledFont["uniF003"].bounds[3] - scaledFont["uniF003"].bounds[1])
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["uniF0BE"].bounds[2] - scaledFont["uniF0BE"].bounds[0])
-			modified = True
-		if glyph.unicode in [0xE368,0xE369]: #lunar eclipse
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(scaledFont["uniF06E"].bounds[2] - scaledFont["uniF06E"].bounds[0])
-			modified = True
-
-	yAdjustment = xAdjustment
-
-	if "Powerline" in fileName:
+# Glyphs that are scaled together by the factor that makes a reference glyph
+# fill the cell, instead of each being fitted on its own. Per font (matched by
+# a substring of its file name): codepoints, reference glyph and axis. If
+# codepoints appear twice, the later rule wins. The reference can be None for
+# the glyph itself, or a pair to measure from the left edge of the first to
+# the right edge of the second glyph.
+#   width       the reference's width fills the cell minus the side bearings
+#   height      the reference's height fills the cap height
+#   fullHeight  the glyph spans the whole line height, for Powerline separators
+#   widthOnly   only the width is scaled, leaving a tenth of the cell on each side
+SCALE_GROUPS = {
+	"codicon": [
+		(range(0xeb6e,0xeb72), "triangle-down", "width"), #triangles
+		(range(0xeab4,0xeab8), "chevron-down", "width"), #chevrons
+		([0xEA9D,0xEA9E,0xEA9F,0xEAA0], "arrow-both", "width"),
+	],
+	"devicons": [
+		(range(0xe7bd,0xe7c4), "uniE60E", "width"), #small letters
+	],
+	"FontAwesome": [
+		([0xf005, 0xf006, 0xf089], "star", "width"), #star
+		(range(0xF026,0xF029), "volume_up", "width"), #volume
+		([0xf02b, 0xf02c], "tags", "width"), #tags
+		(range(0xF031,0xF036), "text_height", "width"), #font stuff
+		([0xf044, 0xf045, 0xf046], "edit", "width"), #edit share check boxes
+		(range(0xF048,0xF053), "fast_forward", "width"), #multimedia buttons
+		(range(0xF060,0xF064), "arrow_up", "width"), #arrows
+		([0xf053, 0xf054, 0xf077, 0xf078], "chevron_up", "width"), #chevron all directions
+		([0xF07D,0xF07E], "resize_horizontal", "width"), #resize
+		([0xf0a4, 0xf0a5, 0xf0a6, 0xf0a7], "hand_right", "width"), #pointing hands
+		([0xf0d7, 0xf0d8, 0xf0d9, 0xf0da, 0xf0dc, 0xf0dd, 0xf0de], "sort", "height"), #carets all directions
+		(range(0xF100,0xF108), "double_angle_up", "width"), #angle
+		([0xF130,0xF131], "microphone_off", "width"), #mic
+		([0xF141,0xF142], "ellipsis_horizontal", "width"), #ellipsis
+		(range(0xF153,0xF15b), "krw", "width"), #currencies
+		(range(0xF157,0xF179), "long_arrow_left", "width"), #long arrows
+		([0xF182,0xF183], "female", "width"), #male and female
+		(range(0xF221,0xF22E), "_517", "width"), #gender or so
+		(range(0xF255,0xF25C), "_563", "width"), #hand symbols
+	],
+	"octicons": [
+		([0xF476,0xF478,0xF49A], "bell-slash", "width"), #bells
+		(range(0xF4EF,0xF4F3), ("move-to-top", "move-to-end"), "width"), #move to
+		([0xF461,0xF47A,0xF493,0xF533], "bookmark-slash", "width"), #bookmarks
+		([0xF416,0xF424,0xF431,0xF432,0xF433,0xF434,0xF43E,0xF443,0xF45C,0xF46C], "arrow-both", "width"), #arrows
+		([0xF438,0xF444,0xF445,0xF44A,0xF44B,0xF460,0xF467,0xF470,0xF47B,0xF47C,0xF47D,0xF47E,0xF48B,0xF4C3,0xF51D], "smiley", "width"), #triangles / small stuff / chevrons / dash / X / github-text
+	],
+	"weather": [
+		(CLOUDS, "uniF003", "width"), # Various
+		([0xE339, 0xE33E, 0xE341], "uniF045", "width"), # degree signs
+		([0xE33F, 0xE340, 0xE344, 0xE347, 0xE348, 0xE349, 0xE352, 0xE353, 0xE37F, 0xE380], "uniF04C", "width"), # arrows
+		(range(0xE34E,0xE351), "uniF053", "height"), # thermometers
+		(range(0xE38D,0xE3A9), "uniF095", "width"), # moon phases
+		(range(0xE3AF,0xE3BC), "uniF0BE", "width"), # wind speed
+		([0xE368,0xE369], "uniF06E", "width"), #lunar eclipse
+	],
+	"Powerline": [
 		#These powerline glyphs should be full width / full height 
-		if glyph.unicode in range(0xE0B0,0xE0CE) or glyph.unicode in [0xE0D1,0xE0D2,0xE0D4]:
-			yAdjustment = 2706/height
-			xAdjustment = yAdjustment
-			modified = True
-		if glyph.unicode == 9776:
-			xAdjustment = (FONTWIDTH-(2*FONTWIDTH*.1))/width # uni2630 requires additional space around it
-			modified = True
-
-	if modified == False:
-
-		# Scaling the glyphs. if a narrow glyph is scaled to the width, it can become too tall, so we limit to the lessor ratio (height vs width)			
-		if (FONTWIDTH-20)/width < FONTHEIGHT/height:
-			xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/width
-		else:
-			xAdjustment = FONTHEIGHT/height
-		yAdjustment = xAdjustment
+		(list(range(0xE0B0,0xE0CE)) + [0xE0D1,0xE0D2,0xE0D4], None, "fullHeight"),
+		([9776], None, "widthOnly"), # uni2630 requires additional space around it
+	],
+}
+
+def scaleRules(fileName):
+	rules = {}
+	for key, groups in SCALE_GROUPS.items():
+		if key in fileName:
+			for codepoints, reference, axis in groups:
+				for codepoint in codepoints:
+					rules[codepoint] = (reference, axis)
+			break
+	return rules
+
+class ScaleGroups:
+	# SCALE_GROUPS of one font as codepoint -> (reference, axis). Factors that
+	# only depend on reference glyphs are computed once per font.
+
+	def __init__(self, fileName, bounds):
+		self.rules = scaleRules(fileName)
+		self.bounds = bounds
+		self.cache = {}
+
+	def references(self, unicode):
+		reference, axis = self.rules.get(unicode, (None, None))
+		if reference is None:
+			return []
+		return sorted(reference) if isinstance(reference, tuple) else [reference]
+
+	def factors(self, unicode, bounds):
+		reference, axis = self.rules.get(unicode, (None, None))
+		if axis is None:
+			return fitGlyph(bounds)
+		if reference is None:
+			return scaleFactors(axis, bounds)
+		if (reference, axis) not in self.cache:
+			if isinstance(reference, tuple):
+				left, right = reference
+				referenceBounds = (self.bounds[left][0], None, self.bounds[right][2], None)
+			else:
+				referenceBounds = self.bounds[reference]
+			self.cache[reference, axis] = scaleFactors(axis, referenceBounds)
+		return self.cache[reference, axis]
+
+def scaleFactors(axis, bounds):
+	if axis == "width":
+		xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/(bounds[2] - bounds[0])
+		return xAdjustment, xAdjustment
+	if axis == "height":
+		xAdjustment = FONTHEIGHT/(bounds[3] - bounds[1])
+		return xAdjustment, xAdjustment
+	if axis == "fullHeight":
+		yAdjustment = FULLHEIGHT/(bounds[3] - bounds[1])
+		return yAdjustment, yAdjustment
+	if axis == "widthOnly":
+		return (FONTWIDTH-(2*FONTWIDTH*.1))/(bounds[2] - bounds[0]), 1
+	raise ValueError(f"unknown scale group axis {axis!r}")
+
+def fitGlyph(bounds):
+	height = bounds[3] - bounds[1]
+	width = bounds[2] - bounds[0]
+	# Scaling the glyphs. if a narrow glyph is scaled to the width, it can become too tall, so we limit to the lessor ratio (height vs width)			
+	if (FONTWIDTH-20)/width < FONTHEIGHT/height:
+		xAdjustment = (FONTWIDTH-(2*SIDEBEARING))/width
+	else:
+		xAdjustment = FONTHEIGHT/height
+	return xAdjustment, xAdjustment
 
-	
-	return xAdjustment, yAdjustment
+def glyphRule(fileName, rules, unicode):
+	# Which of processFont's branches a glyph takes, with the numbers they use.
+	# processFont positions the glyph from this, and the manifest keeps its
+	# fingerprint so that editing a rule reprocesses the glyphs it covers.
+	reference, axis = rules.get(unicode, (None, None))
+	rule = {
+		"scale": [axis or "fit", list(reference) if isinstance(reference, tuple) else reference],
+		"constants": [SIDEBEARING, FONTWIDTH, FONTHEIGHT, FONTUPM, FULLHEIGHT],
+	}
+	if unicode in [0xF159,0xF16A]: # There's some dumb rounding bug that is causing these two to be too wide.
+		rule["stretch"] = 1200
 
-def center(glyph):
-	newHeight = glyph.bounds[3] - glyph.bounds[1]
-	currentY = glyph.bounds[1]
+	if unicode in range(0xE38E,0xE39B): # MOON WAXING exception
+		rule["x"] = ["right", FONTWIDTH-SIDEBEARING]
+	elif unicode in range(0xE39C,0xE3A9): # MOON WANING exception
+		rule["x"] = ["left", SIDEBEARING]
+	else:
+		rule["x"] = ["center", FONTWIDTH]
+
+	if "FontAwesome" in fileName and unicode in [0xF0DC, 0xF0DD, 0xF0DE]:
+		rule["y"] = ["fixed", 65]
+	elif "weather" in fileName and unicode in CLOUDS:
+		rule["y"] = ["fixed", 423]
+	elif "weather" in fileName and unicode in [0xF053,0xF054,0xF055]:
+		rule["y"] = ["fixed", 0]
+	elif "weather" in fileName and unicode == 0xE33E:
+		rule["y"] = ["fixed", -361]
+	elif "Powerline" in fileName and "weather" not in fileName:
+		rule["y"] = ["fixed", 151]
+	else:
+		rule["y"] = ["center", FONTHEIGHT]
+	return rule
+
+def ruleFingerprint(rule):
+	return hashlib.sha256(json.dumps(rule, sort_keys=True).encode()).hexdigest()[:16]
+
+def center(bounds):
+	newHeight = bounds[3] - bounds[1]
+	currentY = bounds[1]
 	adjustment = (FONTHEIGHT-newHeight)/2-currentY
 	return adjustment
 
-#for file in ["original/octicons.ufo"]:
-for file in INPUT.glob("*.ufo"):
-	print ("processing",str(file).split("/")[1])
-	font = OpenFont(str(file))
+def glyphBounds(glyph, *transforms):
+	# Bounds as if the transforms were applied in turn, without moving any points.
+	boundsPen = pen = BoundsPen(None)
+	for transform in reversed(transforms):
+		pen = TransformPen(pen, transform)
+	glyph.draw(pen)
+	return boundsPen.bounds
+
+# Contour direction, giving the same result as defcon's correctContourDirection
+# (which fontParts used), but drawing each contour once instead of once per test point.
+
+def contourArea(contour):
+	pen = AreaPen()
+	pen._endPath = pen._closePath
+	contour.draw(pen)
+	return pen.value
+
+def reverseContour(contour):
+	glyph = ufoLib2.objects.Glyph()
+	contour.drawPoints(ReverseContourPointPen(glyph.getPointPen()))
+	contour.points = glyph.contours[0].points
+
+class SegmentRecordingPen(BasePen):
+	# Records quadratic curves already converted to cubics, so that replaying
+	# doesn't repeat the conversion for every test point.
+
+	def __init__(self):
+		BasePen.__init__(self, None)
+		self.value = []
+
+	def _moveTo(self, pt):
+		self.value.append(("moveTo", (pt,)))
+
+	def _lineTo(self, pt):
+		self.value.append(("lineTo", (pt,)))
+
+	def _curveToOne(self, pt1, pt2, pt3):
+		self.value.append(("curveTo", (pt1, pt2, pt3)))
+
+	def _closePath(self):
+		self.value.append(("closePath", ()))
+
+	def _endPath(self):
+		self.value.append(("endPath", ()))
+
+def contourShape(contour, segmentLength):
+	bounds = BoundsPen(None)
+	contour.draw(bounds)
+	outline = SegmentRecordingPen()
+	contour.draw(outline)
+	flattened = RecordingPen()
+	contour.draw(FlattenPen(flattened, approximateSegmentLength=segmentLength, segmentLines=True))
+	testPoints = [(p.x, p.y) for p in contour if p.type is not None]
+	testPoints.extend(pt for _, args in flattened.value for pt in args)
+	xs = [p.x for p in contour]
+	ys = [p.y for p in contour]
+	# Padded by a unit so that curves BasePen converts on the fly stay inside.
+	controlBounds = (min(xs) - 1, min(ys) - 1, max(xs) + 1, max(ys) + 1)
+	return bounds.bounds, controlBounds, outline, testPoints
+
+def pointInside(shape, point):
+	x, y = point
+	xMin, yMin, xMax, yMax = shape[1]
+	# PointInsidePen skips every segment that lies wholly below, above or left
+	# of the point, so a point outside the control box never counts as inside.
+	if x > xMax or y > yMax or y <= yMin:
+		return False
+	pen = PointInsidePen(None, point)
+	replayRecording(shape[2].value, pen)
+	return pen.getResult()
+
+def contourInside(large, small):
+	if not sectRect(large[0], small[0])[0]:
+		return False
+	tested = set()
+	for point in small[3]:
+		if point in tested:
+			continue
+		if not pointInside(large, point):
+			return False
+		tested.add(point)
+	return True
+
+def correctDirection(glyph, segmentLength=10):
+	areas = []
+	for contour in glyph.contours:
+		area = contourArea(contour)
+		if area < 0:
+			reverseContour(contour)
+			area = contourArea(contour)
+		areas.append(area)
+	# largest first, every contour nested in an odd number of others is a counter
+	contours = [c for _, c in sorted(zip(areas, glyph.contours), key=lambda item: -item[0])]
+	shapes = [contourShape(c, segmentLength) for c in contours]
+	for smallIndex, small in enumerate(shapes):
+		for large in shapes[:smallIndex]:
+			if contourInside(large, small):
+				reverseContour(contours[smallIndex])
+
+# Outlines are moved in bulk: every glyph gets a single
+# x' = xScale * x + dx, y' = yScale * y + dy, rounded like fontParts' round().
+# Anchors move with the points, as they did with fontParts' transformBy.
+
+def transformPoints(points, transforms, round=True):
+	if numpy is not None:
+		counts = [len(p) for p in points]
+		flat = [point for p in points for point in p]
+		xs = numpy.fromiter((point.x for point in flat), float, len(flat))
+		ys = numpy.fromiter((point.y for point in flat), float, len(flat))
+		xScale, yScale, dx, dy = (numpy.repeat(numpy.array(column, float), counts) for column in zip(*transforms))
+		xs = xs * xScale + dx
+		ys = ys * yScale + dy
+		if round:
+			xs = numpy.floor(xs + 0.5).astype(int)
+			ys = numpy.floor(ys + 0.5).astype(int)
+		for point, x, y in zip(flat, xs.tolist(), ys.tolist()):
+			point.x = x
+			point.y = y
+		return
+	for pointList, (xScale, yScale, dx, dy) in zip(points, transforms):
+		for point in pointList:
+			point.x = point.x * xScale + dx
+			point.y = point.y * yScale + dy
+			if round:
+				point.x = math.floor(point.x + 0.5)
+				point.y = math.floor(point.y + 0.5)
+
+def glyphPoints(glyph):
+	return [point for contour in glyph.contours for point in contour] + list(glyph.anchors)
+
+class ReferenceBounds(dict):
+	# Bounds of glyphs scaled to the new UPM and with corrected contour direction,
+	# computed once on first use.
+
+	def __init__(self, font, upmScale):
+		dict.__init__(self)
+		self.font = font
+		self.upmScale = upmScale
+
+	def prepare(self, names):
+		names = [name for name in names if name not in self]
+		glyphs = [self.font[name] for name in names]
+		for glyph in glyphs:
+			# A component would need its base glyph's processed outline for the
+			# bounds, and its offset moved by a transform meant for another
+			# glyph. None of the icon fonts use any, decompose them if one does.
+			if glyph.components or glyph.guidelines:
+				raise ValueError(f"{glyph.name} has components or guidelines, which process.py can't scale")
+		transformPoints([glyphPoints(glyph) for glyph in glyphs], [(self.upmScale, self.upmScale, 0, 0)] * len(glyphs), round=False)
+		for name, glyph in zip(names, glyphs):
+			correctDirection(glyph)
+			self[name] = glyphBounds(glyph)
+
+	def __missing__(self, name):
+		self.prepare([name])
+		return dict.__getitem__(self, name)
+
+def glyphInputs(path):
+	# The default layer always lives in "glyphs"; everything else is hashed as one.
+	glyphSet = GlyphSet(path / "glyphs")
+	glyphs = {name: hashlib.sha256(glyphSet.getGLIF(name)).hexdigest() for name in glyphSet.keys()}
+	unicodes = glyphSet.getUnicodes()
+	digest = hashlib.sha256()
+	for file in sorted(p for p in path.rglob("*") if p.is_file() and p.relative_to(path).parts[0] != "glyphs"):
+		digest.update(file.relative_to(path).as_posix().encode() + b"\0")
+		digest.update(file.read_bytes() + b"\0")
+	return digest.hexdigest(), glyphs, unicodes
+
+def outdatedGlyphs(glyphs, rules, previous):
+	# A glyph needs processing when its own outline or rule changed, or when
+	# one of the reference glyphs its scale group used last time did.
+	previousGlyphs = previous["glyphs"]
+	outdated = set()
+	for name, inputHash in glyphs.items():
+		if name not in previousGlyphs or previousGlyphs[name][0] != inputHash or previousGlyphs[name][2] != rules[name]:
+			outdated.add(name)
+			continue
+		for reference in previousGlyphs[name][1]:
+			if reference not in glyphs or glyphs[reference] != previousGlyphs.get(reference, [None])[0]:
+				outdated.add(name)
+				break
+	return outdated
+
+def processFont(file, previous=None):
+	settings, inputs, unicodes = glyphInputs(file)
+	scale = scaleRules(str(file))
+	rules = {name: glyphRule(str(file), scale, unicodes[name][0] if unicodes[name] else None) for name in inputs}
+	fingerprints = {name: ruleFingerprint(rule) for name, rule in rules.items()}
+	target = OUTPUT / file.name
+	incremental = previous is not None and previous["settings"] == settings and target.exists()
+	names = outdatedGlyphs(inputs, fingerprints, previous) if incremental else set(inputs)
+	removed = set(previous["glyphs"]).difference(inputs) if incremental else set()
+	entry = {"settings": settings, "glyphs": dict(previous["glyphs"]) if incremental else {}}
+	for name in removed:
+		del entry["glyphs"][name]
+	if not names and not removed:
+		print ("unchanged",file.name)
+		return file.name, entry, 0
+
+	if incremental:
+		print ("processing",file.name,f"({len(names)} of {len(inputs)} glyphs, {len(removed)} removed)")
+	else:
+		print ("processing",file.name)
+	font = ufoLib2.Font.open(file, lazy=incremental)
 	originalUPM = font.info.unitsPerEm 
 	font.info.unitsPerEm = FONTUPM
+	reference = ReferenceBounds(font, FONTUPM/originalUPM)
+	reference.prepare(sorted(names))
+	groups = ScaleGroups(str(file), reference)
 
-	for glyph in font: # need to produce a scaled version before we adjust everything else so that there's a reference for the scale groups
-		glyph.transformBy((FONTUPM/originalUPM, 0, 0, FONTUPM/originalUPM, 0, 0))
+	points = []
+	moves = []
+	for name in sorted(names):
+		glyph = font[name]
+		glyph.width = FONTWIDTH
+		glyph.height = otRound(glyph.height)
+		bounds = reference[name]
+		if bounds is None:
+			entry["glyphs"][name] = [inputs[name], [], fingerprints[name]]
+			continue
 
-	scaledFont = font.copy()
+		rule = rules[name]
+		xAdjustment, yAdjustment = groups.factors(glyph.unicode, bounds)
+		entry["glyphs"][name] = [inputs[name], groups.references(glyph.unicode), fingerprints[name]]
+		transforms = [(xAdjustment, 0, 0, yAdjustment, 0, 0)]
+		bounds = glyphBounds(glyph, *transforms)
 
-	for glyph in font:
-		if glyph.bounds is not None:
-			
+		if "stretch" in rule:
+			transforms.append((rule["stretch"]/(bounds[2] - bounds[0]), 0, 0, 1, 0, 0))
+			bounds = glyphBounds(glyph, *transforms)
 
-			glyph.correctDirection()
+		# Positioning the glyph. Looking to center it in the glyph width, and to the cap height value.
+		newWidth = bounds[2] - bounds[0]
+		position, x = rule["x"]
+		if position == "right":
+			widthAdjustment = x-newWidth
+		elif position == "left":
+			widthAdjustment = x
+		else:
+			widthAdjustment = (x-newWidth)/2
 
-			xAdjustment, yAdjustment = scaleGroup(str(file),glyph,SIDEBEARING)
-			glyph.transformBy((xAdjustment, 0, 0, yAdjustment, 0, 0))
+		position, y = rule["y"]
+		if position == "fixed":
+			heightAdjustment = y
+		else:
+			heightAdjustment = center(bounds)
 
-			if glyph.unicode in [0xF159,0xF16A]: # There's some dumb rounding bug that is causing these two to be too wide.
-				glyph.transformBy((1200/(glyph.bounds[2] - glyph.bounds[0]), 0, 0, 1, 0, 0))
+		points.append(glyphPoints(glyph))
+		xScale = math.prod(t[0] for t in transforms)
+		yScale = math.prod(t[3] for t in transforms)
+		moves.append((xScale, yScale, widthAdjustment - bounds[0], heightAdjustment))
 
-			# Positioning the glyph. Looking to center it in the glyph width, and to the cap height value.
-			newWidth = glyph.bounds[2] - glyph.bounds[0]
-			if glyph.unicode in range(0xE38E,0xE39B): # MOON WAXING exception
-				widthAdjustment = FONTWIDTH-SIDEBEARING-newWidth
-			elif glyph.unicode in range(0xE39C,0xE3A9): # MOON WANING exception
-				widthAdjustment = SIDEBEARING
-			else:
-				widthAdjustment = (FONTWIDTH-newWidth)/2
-
-			glyph.leftMargin = widthAdjustment
-			glyph.width = FONTWIDTH
-
-
-			if "FontAwesome" in str(file) and glyph.unicode in [0xF0DC, 0xF0DD, 0xF0DE]:
-					heightAdjustment = 65
-			elif "weather" in str(file):
-				if glyph.unicode in CLOUDS:
-					heightAdjustment = 423
-				elif glyph.unicode in [0xF053,0xF054,0xF055]:
-					pass
-				elif glyph.unicode == 0xE33E:
-					heightAdjustment = -361
-				else:
-					heightAdjustment = center(glyph)
-			elif "Powerline" in str(file):
-				heightAdjustment = 151
-			else:
-				heightAdjustment = center(glyph)
+	transformPoints(points, moves)
+	if incremental:
+		processed = ufoLib2.Font.open(target)
+		for name in removed:
+			del processed[name]
+		for name in names:
+			processed.layers.defaultLayer.insertGlyph(font[name], overwrite=True, copy=False)
+		processed.save()
+	else:
+		font.save(target, overwrite=True)
+	return file.name, entry, len(names) + len(removed)
 
-			glyph.transformBy((1,0,0,1,0,heightAdjustment))
-		else:
-			glyph.width = 1200
-	font.layers[0].round()
+def readManifest(path):
+	if not path.exists():
+		return {}
+	manifest = json.loads(path.read_text())
+	if manifest.get("version") != MANIFEST_VERSION:
+		return {}
+	return manifest["fonts"]
+
+def writeManifest(path, fonts):
+	# One glyph per line keeps the diffs of a partial update readable.
+	lines = ["{", f' "version": {MANIFEST_VERSION},', ' "fonts": {']
+	for fontIndex, (fontName, entry) in enumerate(sorted(fonts.items())):
+		lines.append(f"  {json.dumps(fontName)}: {{")
+		lines.append(f'   "settings": {json.dumps(entry["settings"])},')
+		lines.append('   "glyphs": {')
+		glyphs = sorted(entry["glyphs"].items())
+		for glyphIndex, (name, value) in enumerate(glyphs):
+			lines.append(f"    {json.dumps(name)}: {json.dumps(value)}" + ("," if glyphIndex < len(glyphs) - 1 else ""))
+		lines.append("   }")
+		lines.append("  }" + ("," if fontIndex < len(fonts) - 1 else ""))
+	lines.extend([" }", "}", ""])
+	path.write_text("\n".join(lines))
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Scale the Nerd Fonts glyphs in original/ into processed/.")
+	parser.add_argument("--full", action="store_true", help="Reprocess every glyph instead of only those changed since the last run.")
+	args = parser.parse_args()
 
-	font.save(str(OUTPUT / str(file).split("/")[1]))
\ No newline at end of file
+	previous = {} if args.full else readManifest(MANIFEST)
+	# One font per worker, biggest first so that MaterialDesignIcons doesn't start last.
+	files = sorted(INPUT.glob("*.ufo"), key=lambda f: -sum(1 for _ in f.rglob("*.glif")))
+	fonts = {}
+	changed = 0
+	with multiprocessing.Pool() as pool:
+		jobs = [(file, previous.get(file.name)) for file in files]
+		for name, entry, count in pool.starmap(processFont, jobs):
+			fonts[name] = entry
+			changed += count
+	writeManifest(MANIFEST, fonts)
+	if not changed:
+		print ("nothing changed")
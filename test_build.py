@@ -0,0 +1,297 @@
+import os
+import pickle
+import subprocess
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+build = pytest.importorskip("build")
+ufoLib2 = pytest.importorskip("ufoLib2")
+glifLib = pytest.importorskip("fontTools.ufoLib.glifLib")
+
+
+@pytest.fixture
+def ufo_path(tmp_path):
+    font = ufoLib2.Font()
+    font.newGlyph("a").unicodes = [0x61]
+    font.newGlyph("a.alt").unicodes = [0x61, 0xE000]
+    font.newGlyph("b").unicodes = [0x62]
+    font.newGlyph("b.sc")
+    path = tmp_path / "Test.ufo"
+    font.save(path)
+    return path
+
+
+CMAP = {0x61: "a", 0xE000: "a.alt", 0x62: "b"}
+
+
+def test_font_cmap_does_not_parse_glyphs(ufo_path, monkeypatch):
+    font = ufoLib2.Font.open(ufo_path, lazy=True)
+
+    def read_glyph(*args, **kwargs):
+        raise AssertionError("font_cmap parsed a .glif file")
+
+    monkeypatch.setattr(glifLib.GlyphSet, "readGlyph", read_glyph)
+    assert build.font_cmap(font) == CMAP
+
+
+def test_font_cmap_of_glyphs_not_on_disk(ufo_path):
+    font = ufoLib2.Font.open(ufo_path, lazy=True)
+    font.newGlyph("c").unicodes = [0x63]
+    assert build.font_cmap(font) == {**CMAP, 0x63: "c"}
+
+
+@pytest.mark.parametrize("lazy", [True, False])
+def test_font_cmap_without_reader(ufo_path, lazy):
+    # Such as the masters read back by load_prepared_fonts.
+    font = pickle.loads(pickle.dumps(ufoLib2.Font.open(ufo_path, lazy=lazy)))
+    assert build.font_cmap(font) == CMAP
+
+
+# Glyph pack
+# ****************************************************************
+
+
+@pytest.fixture
+def donor_path(tmp_path):
+    font = ufoLib2.Font()
+    glyph = font.newGlyph("uniE000")
+    glyph.width = 1200
+    glyph.unicodes = [0xE000, 0xF000]
+    pen = glyph.getPointPen()
+    pen.beginPath()
+    pen.addPoint((100, 0), "line")
+    pen.addPoint((100, 700), "line")
+    pen.addPoint((300, 900), "curve", smooth=True)
+    pen.addPoint((500, 900))
+    pen.addPoint((700, 500))
+    pen.addPoint((700, 0), "curve")
+    pen.endPath()
+    pen.beginPath()
+    pen.addPoint((200, 100), "move")
+    pen.addPoint((400, 300), "qcurve")
+    pen.endPath()
+    glyph.appendAnchor({"name": "top", "x": 600, "y": 1420})
+    glyph = font.newGlyph("uniE001")
+    glyph.width = 1200
+    glyph.unicode = 0xE001
+    glyph.components.append(ufoLib2.objects.Component("uniE000", (1, 0, 0, -1, 0, 1420)))
+    font.newGlyph("space").width = 1200
+    path = tmp_path / "Icons.ufo"
+    font.save(path)
+    return path
+
+
+def glyph_data(glyph):
+    return (
+        glyph.name,
+        glyph.width,
+        glyph.unicodes,
+        [[(p.x, p.y, p.type, p.smooth) for p in contour] for contour in glyph.contours],
+        [(c.baseGlyph, tuple(c.transformation)) for c in glyph.components],
+        [(a.name, a.x, a.y) for a in glyph.anchors],
+    )
+
+
+@pytest.fixture
+def glyph_pack_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(build, "GLYPH_PACK_FILE", tmp_path / "build" / "test.glyphpack")
+    build.open_glyph_pack.cache_clear()
+    build.hash_path.cache_clear()
+    yield build.GLYPH_PACK_FILE
+    build.open_glyph_pack.cache_clear()
+    build.open_donor_ufo.cache_clear()
+    build.hash_path.cache_clear()
+
+
+def test_glyph_pack_round_trip(donor_path, glyph_pack_file):
+    build.write_glyph_pack([donor_path], glyph_pack_file)
+    pack = build.open_glyph_pack(glyph_pack_file)
+    assert list(pack) == ["Icons.ufo"]
+    assert [glyph_data(g) for g in build.glyph_pack_glyphs(pack["Icons.ufo"])] == [
+        glyph_data(g) for g in ufoLib2.Font.open(donor_path)
+    ]
+
+
+def test_stale_glyph_pack(donor_path, glyph_pack_file):
+    build.update_glyph_pack([donor_path])
+    assert build.open_glyph_pack(glyph_pack_file)["Icons.ufo"].hash == build.hash_path(donor_path)
+
+    font = ufoLib2.Font.open(donor_path)
+    font["space"].width = 600
+    font.save()
+    build.hash_path.cache_clear()
+    # The stale pack is not used, the UFO is read instead.
+    assert {g.name: g.width for g in build.donor_glyphs(donor_path)}["space"] == 600
+
+    build.update_glyph_pack([donor_path])
+    pack = build.open_glyph_pack(glyph_pack_file)
+    assert pack["Icons.ufo"].hash == build.hash_path(donor_path)
+    assert [glyph_data(g) for g in build.glyph_pack_glyphs(pack["Icons.ufo"])] == [
+        glyph_data(g) for g in ufoLib2.Font.open(donor_path)
+    ]
+
+
+# Build cache
+# ****************************************************************
+
+NAME = "Cascadia Code"
+
+
+def write_cache_inputs(root):
+    """Write stand-ins for everything cache_key hashes under root and point
+    build.py at them, returning the designspace to key by."""
+    build.FEATURES_DIR = root / "features"
+    build.INPUT_DIR = root
+    build.VTT_DATA_FILE = root / "vtt.ttf"
+    build.ITALIC_VTT_DATA_FILE = root / "vtt_italic.ttf"
+    build.FEATURES_DIR.mkdir(exist_ok=True)
+    for path in {*build.feature_files(build.FEATURES_DIR, NAME), *build.feature_files(build.FEATURES_DIR, NAME + " Mono")}:
+        path.write_text(f"# {path.name}\n")
+    for path in [build.VTT_DATA_FILE, build.ITALIC_VTT_DATA_FILE, root / "stat.yaml"]:
+        path.write_bytes(path.name.encode())
+    source = root / "Master.ufo"
+    source.mkdir(exist_ok=True)
+    (source / "fontinfo.plist").write_text("<plist/>")
+    (root / "Test.designspace").write_text("<designspace/>")
+    return SimpleNamespace(
+        path=os.fspath(root / "Test.designspace"),
+        sources=[SimpleNamespace(path=os.fspath(source))],
+    )
+
+
+@pytest.fixture
+def designspace(tmp_path, monkeypatch):
+    # Let monkeypatch put back what write_cache_inputs replaces.
+    for name in ["FEATURES_DIR", "INPUT_DIR", "VTT_DATA_FILE", "ITALIC_VTT_DATA_FILE"]:
+        monkeypatch.setattr(build, name, getattr(build, name))
+    build.hash_path.cache_clear()
+    yield write_cache_inputs(tmp_path)
+    build.hash_path.cache_clear()
+
+
+def changed_key(key, edit):
+    """Whether the key is different after edit() changed its inputs."""
+    before = key()
+    edit()
+    build.hash_path.cache_clear()
+    return key() != before
+
+
+def test_cache_key_follows_sources(designspace):
+    source = Path(designspace.sources[0].path)
+    assert changed_key(
+        lambda: build.cache_key(designspace, NAME),
+        lambda: (source / "metainfo.plist").write_text("<plist/>"),
+    )
+    assert changed_key(
+        lambda: build.cache_key(designspace, NAME),
+        lambda: (source / "fontinfo.plist").write_text("<plist></plist>"),
+    )
+    assert changed_key(
+        lambda: build.cache_key(designspace, NAME),
+        lambda: Path(designspace.path).write_text("<designspace></designspace>"),
+    )
+
+
+def test_cache_key_follows_features(designspace):
+    path = build.feature_files(build.FEATURES_DIR, NAME)[-1]
+    assert changed_key(
+        lambda: build.cache_key(designspace, NAME),
+        lambda: path.write_text("feature rlig {} rlig;\n"),
+    )
+
+
+def test_cache_key_follows_flags(designspace):
+    key = build.cache_key(designspace, NAME)
+    assert build.cache_key(designspace, NAME, ["static"]) != key
+    assert build.cache_key(designspace, NAME + " Mono") != key
+    assert build.variable_cache_key(designspace, NAME, True) != build.variable_cache_key(
+        designspace, NAME, False
+    )
+    instance = SimpleNamespace(name="Regular")
+    assert build.static_cache_key(designspace, instance, NAME, ["ttf"]) != build.static_cache_key(
+        designspace, instance, NAME, ["otf"]
+    )
+    assert changed_key(
+        lambda: build.variable_cache_key(designspace, NAME, True),
+        lambda: build.VTT_DATA_FILE.write_bytes(b"hinted"),
+    )
+
+
+def test_cache_key_follows_tool_versions(designspace, monkeypatch):
+    version = build.metadata.version
+    key = build.cache_key(designspace, NAME)
+    woff2_key = build.woff2_cache_key(b"ttf", Path("build/a.woff2"), 11)
+    monkeypatch.setattr(
+        build.metadata,
+        "version",
+        lambda tool: "0.0+test" if tool == "fonttools" else version(tool),
+    )
+    assert build.cache_key(designspace, NAME) != key
+    assert build.woff2_cache_key(b"ttf", Path("build/a.woff2"), 11) != woff2_key
+
+
+def test_postprocess_cache_keys():
+    key = build.woff2_cache_key(b"ttf", Path("build/a.woff2"), 11)
+    assert build.woff2_cache_key(b"ttf", Path("build/a.woff2"), 11) == key
+    assert build.woff2_cache_key(b"otf", Path("build/a.woff2"), 11) != key
+    assert build.woff2_cache_key(b"ttf", Path("build/b.woff2"), 11) != key
+    assert build.woff2_cache_key(b"ttf", Path("build/a.woff2"), 9) != key
+    tools = {"ttfautohint": "1.8.4"}
+    key = build.postprocess_cache_key(b"ttf", Path("build/a.ttf"), "ttfautohint", tools)
+    assert build.postprocess_cache_key(b"ttf", Path("build/a.ttf"), "ttfautohint", tools) == key
+    assert build.postprocess_cache_key(b"ttf", Path("build/a.ttf"), "psautohint", tools) != key
+    assert (
+        build.postprocess_cache_key(b"ttf", Path("build/a.ttf"), "ttfautohint", {"ttfautohint": "1.8.3"})
+        != key
+    )
+
+
+def test_cache_key_is_stable_across_runs(designspace, tmp_path):
+    # A new interpreter hashes strings differently, the key must not depend on that.
+    script = (
+        "import sys, pathlib, build, test_build\n"
+        "print(build.cache_key(test_build.write_cache_inputs(pathlib.Path(sys.argv[1])), sys.argv[2]))"
+    )
+    keys = {build.cache_key(designspace, NAME)}
+    for seed in ["1", "2"]:
+        result = subprocess.run(
+            [sys.executable, "-c", script, os.fspath(tmp_path), NAME],
+            cwd=Path(build.__file__).parent,
+            env={**os.environ, "PYTHONHASHSEED": seed},
+            stdout=subprocess.PIPE,
+            check=True,
+            text=True,
+        )
+        keys.add(result.stdout.strip())
+    assert len(keys) == 1
+
+
+def test_cache_restore_puts_back_stored_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(build, "OUTPUT_DIR", tmp_path / "build")
+    cache_dir = tmp_path / "build" / "cache"
+    outputs = {
+        build.OUTPUT_DIR / "ttf" / "Test.ttf": b"\x00\x01\x00\x00 ttf",
+        build.OUTPUT_DIR / "woff2" / "static" / "Test.woff2": b"wOF2",
+    }
+    for path, data in outputs.items():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    build.cache_store(cache_dir, "key", list(outputs))
+    # The same entry again, as a concurrent job would store it.
+    build.cache_store(cache_dir, "key", list(outputs))
+    assert [p.name for p in cache_dir.iterdir()] == ["key"]
+
+    for path in outputs:
+        path.write_bytes(b"changed")
+    (build.OUTPUT_DIR / "ttf" / "Other.ttf").write_bytes(b"other")
+    assert build.cache_restore(cache_dir, "key") == list(outputs)
+    assert {path: path.read_bytes() for path in outputs} == outputs
+    assert (build.OUTPUT_DIR / "ttf" / "Other.ttf").read_bytes() == b"other"
+
+    assert build.cache_restore(cache_dir, "other") is None
+    assert build.cache_restore(None, "key") is None
+    assert not build.cache_contains(None, "key")